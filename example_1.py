@@ -4,6 +4,8 @@ import rcs
 from time import sleep
 def main():
 
+    # Log file 'robots_communications.log' and console, written by a background thread
+    rcs.configure_logging(queued = True)
 
     r1r2_1 = rcs.RCS('robo1', 'robo2', model = "distance", distance_threshold = 15)
     r1r2_2 = rcs.RCS('robo1', 'robo2', model = "line_of_sight")
@@ -1,8 +1,5 @@
-import pymorse
-import math, sys
-import logging
-import gdal, numpy
-from gdalconst import *
+import math, sys, os, time, importlib
+import logging, threading, queue, atexit, collections
 
 """ Install first the Requirements:
 
@@ -15,24 +12,1444 @@ git clone git://github.com/numpy/numpy.git
 cd numpy/
 git checkout v1.7.1
 sudo python3 setup.py install
+
+Import time: the heavy dependencies are only imported when they are needed (see LazyModule):
+numpy by the Path Loss Map rasters and the batch functions, gdal by the Path Loss Map model, and pymorse by the first
+Morse connection. 'import rcs' must not import any of them and should take less than 20 ms
+(python3 -X importtime -c 'import rcs', or the import benchmark of rcs_benchmark.py).
 """
 
+# -----------------------------LAZY IMPORTS --------------------------------------------
+
+## @brief Module imported on the first access to one of its attributes.
+# @details On that access, the global name of this module is replaced by the imported module, so the following uses
+# do not go through this class.
+class LazyModule():
+
+    ## @param[in] name Name of the module (e.g. 'gdal').
+    def __init__(self, name):
+        self.__name = name
+
+    ## @param[in] attribute Name of the attribute of the module.
+    # @return The attribute of the imported module.
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self.__name)
+        if globals().get(self.__name) is self:
+            globals()[self.__name] = module
+        return getattr(module, attribute)
+
+numpy = LazyModule('numpy')
+gdal = LazyModule('gdal')
+gdalconst = LazyModule('gdalconst')
+pymorse = LazyModule('pymorse')
+# --------------------------------------------------------------------------------------
+
 # -----------------------------LOGGING CONFIGURATION -----------------------------------
+## @brief Logger of the module (and of rcs_network, rcs_async, rcs_los...).
+# @details No handler is added at import time: call configure_logging() to write the records to a file and/or the console.
 logger = logging.getLogger("morse."+__name__)
 logger.setLevel(logging.DEBUG)
-# File Handler
-fh = logging.FileHandler('robots_communications.log', mode = 'w')
-fh.setLevel(logging.DEBUG)
-# Console Handler
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
 # Formatter for both Handlers
 formatter = logging.Formatter('[%(asctime)s (%(levelname)s)]  %(message)s', "%H:%M:%S")
-fh.setFormatter(formatter)
-ch.setFormatter(formatter)
-# Add Handlers to the logger
-logger.addHandler(fh)
-logger.addHandler(ch)
+
+
+## @brief Filter of the records of each pair of robots (records with the 'pair' and 'result' attributes, see RCS).
+# @details A record of a pair is dropped if:
+# - it comes less than min_interval seconds after the last record kept for the same pair, or
+# - changes_only is True and the result is the same of the last record kept for the same pair.
+# @details Records of errors and records without a pair are always kept.
+class PairLogFilter(logging.Filter):
+
+    ## @param[in] min_interval Units: seconds. Minimum time between 2 records of the same pair (None for no limit).
+    # @param[in] changes_only Boolean to keep only the records whose result changed.
+    def __init__(self, min_interval = None, changes_only = False):
+        logging.Filter.__init__(self)
+        self.min_interval = min_interval
+        self.changes_only = changes_only
+        ## @brief Dictionary {pair: (time, result)} of the last record kept for each pair
+        self.__last = {}
+        ## @brief Number of records dropped
+        self.dropped = 0
+
+    ## @param[in] record logging.LogRecord.
+    # @return True if the record is kept.
+    def filter(self, record):
+        pair = getattr(record, 'pair', None)
+        if (pair is None) or (record.levelno >= logging.ERROR):
+            return True
+        last = self.__last.get(pair)
+        if last is not None:
+            if self.changes_only and (last[1] == record.result):
+                self.dropped += 1
+                return False
+            if (self.min_interval is not None) and (record.created - last[0] < self.min_interval):
+                self.dropped += 1
+                return False
+        self.__last[pair] = (record.created, record.result)
+        return True
+
+
+## @brief Handler that only puts the records in a queue: formatting and writing are done by a LogWriter thread.
+# @details Like logging.handlers.QueueHandler, but the record is queued as it is: the message is formatted by the LogWriter thread, not by the caller.
+# @note The arguments of the log calls must not be modified after the call (numbers and strings in this module).
+class LogQueueHandler(logging.Handler):
+
+    ## @param[in] queue Queue read by a LogWriter.
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    ## @param[in] record logging.LogRecord.
+    def emit(self, record):
+        self.queue.put_nowait(record)
+
+
+## @brief Thread that writes the queued records (see LogQueueHandler) in batches: one write and one flush per handler and batch.
+class LogWriter(threading.Thread):
+
+    ## @brief Maximum number of records written at a time
+    __batch_size = 1024
+
+    ## @param[in] queue Queue filled by a LogQueueHandler.
+    # @param[in] handlers List with the stream handlers (logging.StreamHandler or logging.FileHandler) to write to.
+    def __init__(self, queue, handlers):
+        threading.Thread.__init__(self, name = 'rcs-log-writer', daemon = True)
+        self.queue = queue
+        self.handlers = handlers
+
+    ## @brief Writes the records until stop() is called.
+    def run(self):
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < self.__batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                running = False
+            for handler in self.handlers:
+                lines = []
+                for record in batch:
+                    if record.levelno >= handler.level:
+                        # Like logging.Handler.emit(): a record that can not be formatted is reported and the others are still written
+                        try:
+                            lines.append(handler.format(record) + handler.terminator)
+                        except Exception:
+                            handler.handleError(record)
+                if lines:
+                    with handler.lock:
+                        try:
+                            handler.stream.write(''.join(lines))
+                            handler.stream.flush()
+                        except Exception:
+                            handler.handleError(batch[-1])
+
+    ## @brief Writes the records still in the queue and stops the thread.
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+
+## @brief Current logging configuration (see configure_logging())
+log_configuration = {'handlers': [], 'attached': [], 'filter': None, 'writer': None}
+
+
+## @brief Adds handlers to the module logger. Before, the file and console handlers were always added at import time.
+# @param[in] filename Name of the log file (None for no file).
+# @param[in] console Boolean to write (or not) the records to the console.
+# @param[in] queued Boolean: if True, the caller only puts the records in a queue and a background thread (LogWriter) formats and writes them in batches.
+# @param[in] min_interval Units: seconds. Minimum time between 2 records of the same pair of robots (see PairLogFilter).
+# @param[in] changes_only Boolean to log only the results of a pair of robots that changed (see PairLogFilter).
+# @param[in] level Level of the handlers.
+# @details A previous configuration is removed first (see stop_logging()).
+# @details Usage examples:
+# @code rcs.configure_logging()                                                 # the same handlers of older versions
+# rcs.configure_logging(console = False, queued = True, changes_only = True)      # for high query rates @endcode
+def configure_logging(filename = 'robots_communications.log', console = True, queued = False, min_interval = None, changes_only = False, level = logging.DEBUG):
+    stop_logging()
+    handlers = []
+    if filename is not None:
+        # File Handler
+        handlers.append(logging.FileHandler(filename, mode = 'w'))
+    if console:
+        # Console Handler
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setLevel(level)
+        handler.setFormatter(formatter)
+
+    if queued:
+        records = queue.SimpleQueue()
+        log_configuration['writer'] = LogWriter(records, handlers)
+        log_configuration['writer'].start()
+        log_configuration['attached'] = [LogQueueHandler(records)]
+    else:
+        log_configuration['attached'] = handlers
+    for handler in log_configuration['attached']:
+        logger.addHandler(handler)
+    log_configuration['handlers'] = handlers
+
+    if (min_interval is not None) or changes_only:
+        log_configuration['filter'] = PairLogFilter(min_interval, changes_only)
+        logger.addFilter(log_configuration['filter'])
+        if stats.enabled:
+            # Only the records kept by the filter are counted
+            stats.enable()
+
+
+## @brief Removes the handlers added by configure_logging(): the queued records are written and the files are closed.
+def stop_logging():
+    for handler in log_configuration['attached']:
+        logger.removeHandler(handler)
+    if log_configuration['filter'] is not None:
+        logger.removeFilter(log_configuration['filter'])
+    if log_configuration['writer'] is not None:
+        log_configuration['writer'].stop()
+    for handler in log_configuration['handlers']:
+        handler.close()
+    log_configuration.update({'handlers': [], 'attached': [], 'filter': None, 'writer': None})
+
+atexit.register(stop_logging)
+# --------------------------------------------------------------------------------------
+
+
+# -----------------------------INSTRUMENTATION -----------------------------------------
+
+## @brief Timings and counters of the hot paths of this module (Morse requests, Path Loss Map reads, logging...).
+# @details It is disabled by default: each instrumented point then costs a single method call.
+# When enabled, these stages are timed:
+# - 'can_communicate.<model>': whole RCS.can_communicate() call,
+# - 'rpc': Morse service request (round trip), 'pose': read of a Pose sensor,
+# - 'gdal_open': gdal.Open() of a Path Loss Map, 'plm_load': read of a raster by the PLMCache, 'block_read': read of a block ('window' sampling),
+# - 'plm_lookup': pixel conversion and lookup of the path loss (or class) under a robot,
+# and these events are counted: 'snapshot_hits', 'snapshot_misses', 'plm_cache_hits', 'plm_cache_misses', 'plm_bytes_read', 'log_records'.
+# @details Usage examples:
+# @code rcs.stats.enable()
+# ...
+# print(rcs.stats.get()['stages']['rpc'])
+# open('rcs.prom', 'w').write(rcs.stats.to_prometheus())
+# rcs.stats.reset() @endcode
+class RCSStats():
+
+    def __init__(self):
+        ## @brief Boolean: the instrumented points only record data when it is True
+        self.enabled = False
+        ## @brief Timings of each stage: stage -> [count, total (seconds), maximum (seconds)]
+        self.__stages = {}
+        ## @brief Counters of each event: name -> value
+        self.__counters = {}
+        self.__lock = threading.Lock()
+
+    ## @brief Starts recording. The number of log records is counted through a filter of the module logger.
+    # @details The counter is always the last filter of the logger (configure_logging() calls this method again after adding
+    # a PairLogFilter), so 'log_records' is the number of records kept, whatever the order of the calls.
+    # The records dropped by a PairLogFilter are counted by its attribute 'dropped'.
+    def enable(self):
+        logger.removeFilter(self.__count_log_record)
+        logger.addFilter(self.__count_log_record)
+        self.enabled = True
+
+    ## @brief Stops recording (the data recorded is kept, see reset()).
+    def disable(self):
+        if self.enabled:
+            logger.removeFilter(self.__count_log_record)
+            self.enabled = False
+
+    ## @brief Discards the data recorded.
+    def reset(self):
+        with self.__lock:
+            self.__stages.clear()
+            self.__counters.clear()
+
+    ## @return The start time of a stage (see stop()), or None if disabled.
+    def start(self):
+        if self.enabled:
+            return time.perf_counter()
+        return None
+
+    ## @param[in] stage Name of the stage.
+    # @param[in] start Value returned by start() at the beginning of the stage.
+    def stop(self, stage, start):
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        with self.__lock:
+            timing = self.__stages.get(stage)
+            if timing is None:
+                self.__stages[stage] = [1, elapsed, elapsed]
+            else:
+                timing[0] += 1
+                timing[1] += elapsed
+                if elapsed > timing[2]:
+                    timing[2] = elapsed
+
+    ## @param[in] name Name of the event.
+    # @param[in] value Value added to the counter.
+    def count(self, name, value = 1):
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    ## @return Dictionary with a snapshot of the data recorded:
+    # {'stages': {stage: {'count', 'sum', 'max', 'mean'}}, 'counters': {name: value}}. Times are in seconds.
+    def get(self):
+        with self.__lock:
+            stages = dict((stage, {'count': c, 'sum': s, 'max': m, 'mean': s/c}) for stage, (c, s, m) in self.__stages.items())
+            return {'stages': stages, 'counters': dict(self.__counters)}
+
+    ## @return String with a JSON snapshot of the data recorded (see get()).
+    def to_json(self):
+        import json
+        return json.dumps(self.get(), sort_keys = True)
+
+    ## @param[in] prefix Prefix of the metric names.
+    # @return String with the data recorded in the Prometheus text format.
+    def to_prometheus(self, prefix = 'rcs'):
+        data = self.get()
+        lines = ['# TYPE %s_stage_seconds summary' %prefix]
+        for stage, timing in sorted(data['stages'].items()):
+            lines.append('%s_stage_seconds_count{stage="%s"} %i' %(prefix, stage, timing['count']))
+            lines.append('%s_stage_seconds_sum{stage="%s"} %.9f' %(prefix, stage, timing['sum']))
+        lines.append('# TYPE %s_stage_seconds_max gauge' %prefix)
+        for stage, timing in sorted(data['stages'].items()):
+            lines.append('%s_stage_seconds_max{stage="%s"} %.9f' %(prefix, stage, timing['max']))
+        lines.append('# TYPE %s_events_total counter' %prefix)
+        for name, value in sorted(data['counters'].items()):
+            lines.append('%s_events_total{event="%s"} %i' %(prefix, name, value))
+        return '\n'.join(lines) + '\n'
+
+    ## @param[in] record logging.LogRecord.
+    # @return True: the record is only counted.
+    def __count_log_record(self, record):
+        self.count('log_records')
+        return True
+
+
+## @brief Instrumentation used by every RCS instance of this process.
+stats = RCSStats()
+# --------------------------------------------------------------------------------------
+
+
+# -----------------------------PATH LOSS MAP RASTERS ----------------------------------
+
+## @param[in] dataset GDAL dataset of a Path Loss Map file.
+# @return Dictionary with the custom origin and the geotransform of the Path Loss Map.
+# @see get_pixel_coordinates()
+def get_plm_gdalinfo(dataset):
+    gdalinfo = {}
+    gdalinfo['X_custom_origin'] = float(dataset.GetMetadata()['CUSTOM_X_ORIGIN'])
+    gdalinfo['Y_custom_origin'] = float(dataset.GetMetadata()['CUSTOM_Y_ORIGIN'])
+    geotransform = dataset.GetGeoTransform()
+    gdalinfo['X_utm_origin'] = geotransform[0]
+    gdalinfo['Y_utm_origin'] = geotransform[3]
+    gdalinfo['X_scale'] = geotransform[1]
+    gdalinfo['Y_scale'] = geotransform[5]
+    return gdalinfo
+
+
+## @brief Path Loss Map raster decoded in memory ('full' sampling).
+# @details It keeps the full band of a Path Loss Map file together with its custom origin and geotransform,
+# so the path loss under any robot can be sampled without opening the file again.
+class PLMRaster():
+
+    ## @param[in] dataset GDAL dataset of the Path Loss Map file (opened in read-only mode).
+    def __init__(self, dataset):
+        ## @brief Dictionary with the custom origin and the geotransform of the Path Loss Map
+        self.gdalinfo = get_plm_gdalinfo(dataset)
+        ## @brief Number of columns and rows of the raster
+        self.ncols = dataset.RasterXSize
+        self.nrows = dataset.RasterYSize
+        band = dataset.GetRasterBand(1) # For this case, each pixel will have only a float32 value
+        ## @brief Path losses of the whole map (Numpy array)
+        self.map_data = band.ReadAsArray(0, 0, self.ncols, self.nrows)
+        ## @brief Memory used by this raster (bytes)
+        self.nbytes = self.map_data.nbytes
+        stats.count('plm_bytes_read', self.nbytes)
+
+    ## @param[in] pixel Dictionary with the pixel coordinates (x,y).
+    # @return The path loss stored in that pixel.
+    def get_pathloss(self, pixel):
+        # Important Numpy note to read an array element: array[row][col]
+        return self.map_data[pixel['y']][pixel['x']]
+
+    ## @param[in] cols Numpy array with the pixel coordinates x.
+    # @param[in] rows Numpy array with the pixel coordinates y.
+    # @return Numpy array with the path losses stored in those pixels.
+    def get_pathlosses(self, cols, rows):
+        return self.map_data[rows, cols]
+
+
+## @brief Path Loss Map raster sampled block by block ('window' sampling).
+# @details The file is kept open and only the block (tile or strip) containing the requested pixel is read,
+# so the cost of each query does not depend on the size of the map.
+# The most recently read blocks are kept, because the robots usually stay in the same block for many queries.
+# @note Tiled GeoTIFFs (e.g. 'gdal_translate -co TILED=YES') keep the blocks small. In a striped GeoTIFF each block is a full row.
+class PLMWindowRaster():
+
+    ## @brief Number of blocks kept in memory by each raster.
+    __blocks_kept = 16
+
+    ## @param[in] dataset GDAL dataset of the Path Loss Map file (opened in read-only mode).
+    def __init__(self, dataset):
+        ## @brief Dictionary with the custom origin and the geotransform of the Path Loss Map
+        self.gdalinfo = get_plm_gdalinfo(dataset)
+        ## @brief Number of columns and rows of the raster
+        self.ncols = dataset.RasterXSize
+        self.nrows = dataset.RasterYSize
+        self.__dataset = dataset
+        self.__band = dataset.GetRasterBand(1)
+        ## @brief Size (columns, rows) of the blocks of the raster
+        self.block_size = tuple(self.__band.GetBlockSize())
+        ## @brief Blocks read, from the least to the most recently used: (block col, block row) -> Numpy array
+        self.__blocks = collections.OrderedDict()
+        # GDAL datasets must not be read by several threads at the same time
+        self.__lock = threading.Lock()
+        ## @brief Memory used by this raster when all its blocks are kept (bytes)
+        self.nbytes = self.__blocks_kept * self.block_size[0] * self.block_size[1] * (gdal.GetDataTypeSize(self.__band.DataType) // 8)
+
+    ## @param[in] pixel Dictionary with the pixel coordinates (x,y).
+    # @return The path loss stored in that pixel.
+    def get_pathloss(self, pixel):
+        key = (pixel['x'] // self.block_size[0], pixel['y'] // self.block_size[1])
+        with self.__lock:
+            block = self.__blocks.get(key)
+            if block is None:
+                xoff = key[0] * self.block_size[0]
+                yoff = key[1] * self.block_size[1]
+                # The blocks in the right and bottom edges of the map may be smaller
+                start = stats.start()
+                block = self.__band.ReadAsArray(xoff, yoff, min(self.block_size[0], self.ncols - xoff), min(self.block_size[1], self.nrows - yoff))
+                stats.stop('block_read', start)
+                stats.count('plm_bytes_read', block.nbytes)
+                self.__blocks[key] = block
+                if len(self.__blocks) > self.__blocks_kept:
+                    self.__blocks.popitem(last = False)
+            else:
+                self.__blocks.move_to_end(key)
+        # Important Numpy note to read an array element: array[row][col]
+        return block[pixel['y'] % self.block_size[1]][pixel['x'] % self.block_size[0]]
+
+    ## @param[in] cols Numpy array with the pixel coordinates x.
+    # @param[in] rows Numpy array with the pixel coordinates y.
+    # @return Numpy array with the path losses stored in those pixels.
+    # @note The pixels are read one by one (only the blocks containing them are loaded).
+    def get_pathlosses(self, cols, rows):
+        result = numpy.empty(numpy.shape(cols), dtype = numpy.float32)
+        for i, (col, row) in enumerate(zip(numpy.ravel(cols), numpy.ravel(rows))):
+            result.flat[i] = self.get_pathloss({'x': int(col), 'y': int(row)})
+        return result
+
+    ## @param[in] xoff Pixel coordinate x of the first column.
+    # @param[in] yoff Pixel coordinate y of the first row.
+    # @param[in] ncols Number of columns.
+    # @param[in] nrows Number of rows.
+    # @return Numpy array (nrows x ncols) with the path losses of that region, read directly from the file (the blocks kept are not used).
+    def read(self, xoff, yoff, ncols, nrows):
+        with self.__lock:
+            start = stats.start()
+            region = self.__band.ReadAsArray(xoff, yoff, ncols, nrows)
+            stats.stop('block_read', start)
+        stats.count('plm_bytes_read', region.nbytes)
+        return region
+
+
+## @param[in] pathlosses Numpy array with path losses.
+# @param[in] thresholds Tuple with the thresholds (t1, t2, t3) of the Path Loss Map model.
+# @return uint8 Numpy array with the Data Rate class of each path loss:
+# 0 if there is no data rate (negative path loss), 1 to 4 for the Data Rates dr0 to dr3.
+# @details Since the classes grow with the path loss, the class of the maximum path loss of 2 robots is the maximum of their classes.
+def bake_plm_classes(pathlosses, thresholds):
+    pathlosses = numpy.asarray(pathlosses)
+    # Negative (or NaN) path losses have the class 0
+    return numpy.where(pathlosses >= 0, numpy.digitize(pathlosses, thresholds) + 1, 0).astype(numpy.uint8)
+
+
+## @param[in] plm Dictionary with the parameters of the Path Loss Map model (see RCS.check_plm_dictionary()).
+# @return 5 x 5 Numpy array with the Data Rate (Mb/s) of each pair of Data Rate classes (see bake_plm_classes()).
+def get_plm_rate_table(plm):
+    rates = numpy.array([0, plm['dr0'], plm['dr1'], plm['dr2'], plm['dr3']])
+    classes = numpy.arange(len(rates))
+    return rates[numpy.maximum.outer(classes, classes)]
+
+
+## @brief Path Loss Map raster baked into Data Rate classes ('classes' sampling).
+# @details The path losses are quantized at load time into a uint8 raster (see bake_plm_classes()), a quarter of the float32 size,
+# and each query of a pair of robots only needs 2 array reads and a lookup in the table given by get_plm_rate_table().
+# @details Files already baked by bake_plm() are used directly, if they were baked with the same thresholds.
+class PLMClassRaster():
+
+    ## @brief Number of rows quantized at a time, so the float32 band is never fully loaded.
+    __rows_per_read = 1024
+
+    ## @param[in] dataset GDAL dataset of the Path Loss Map file (opened in read-only mode).
+    # @param[in] thresholds Tuple with the thresholds (t1, t2, t3) of the Path Loss Map model.
+    # @exception Exit if the file was baked with other thresholds.
+    def __init__(self, dataset, thresholds):
+        ## @brief Dictionary with the custom origin and the geotransform of the Path Loss Map
+        self.gdalinfo = get_plm_gdalinfo(dataset)
+        ## @brief Number of columns and rows of the raster
+        self.ncols = dataset.RasterXSize
+        self.nrows = dataset.RasterYSize
+        ## @brief Tuple with the thresholds (t1, t2, t3) used to bake the raster
+        self.thresholds = tuple(thresholds)
+        band = dataset.GetRasterBand(1)
+        baked = dataset.GetMetadata().get('PLM_THRESHOLDS')
+        if baked is not None:
+            if tuple(float(t) for t in baked.split(',')) != tuple(float(t) for t in self.thresholds):
+                logger.error('\n\nThe Path Loss Map was baked with the thresholds (%s), not %s.\nBye...\n\n' %(baked, self.thresholds))
+                sys.exit(1)
+            map_data = band.ReadAsArray(0, 0, self.ncols, self.nrows).astype(numpy.uint8)
+            stats.count('plm_bytes_read', map_data.nbytes)
+        else:
+            map_data = numpy.empty((self.nrows, self.ncols), dtype = numpy.uint8)
+            for yoff in range(0, self.nrows, self.__rows_per_read):
+                rows = min(self.__rows_per_read, self.nrows - yoff)
+                pathlosses = band.ReadAsArray(0, yoff, self.ncols, rows)
+                stats.count('plm_bytes_read', pathlosses.nbytes)
+                map_data[yoff:yoff+rows] = bake_plm_classes(pathlosses, self.thresholds)
+        ## @brief Data Rate classes of the whole map (uint8 Numpy array)
+        self.map_data = map_data
+        ## @brief Memory used by this raster (bytes)
+        self.nbytes = self.map_data.nbytes
+
+    ## @param[in] pixel Dictionary with the pixel coordinates (x,y).
+    # @return The Data Rate class of that pixel.
+    def get_class(self, pixel):
+        # Important Numpy note to read an array element: array[row][col]
+        return self.map_data[pixel['y']][pixel['x']]
+
+    ## @param[in] cols Numpy array with the pixel coordinates x.
+    # @param[in] rows Numpy array with the pixel coordinates y.
+    # @return Numpy array with the Data Rate classes of those pixels.
+    def get_classes(self, cols, rows):
+        return self.map_data[rows, cols]
+
+
+## @brief Path Loss Map raster with a min/max pyramid, quantized into Data Rate classes ('pyramid' sampling).
+# @details At load time, the minimum and maximum path loss of each tile of __tile x __tile pixels is kept (level 0), and each
+# following level keeps the minimum and maximum of 2 x 2 tiles of the previous one, up to a single tile. A tile whose minimum
+# and maximum fall in the same Data Rate class (see bake_plm_classes()) is uniform: the class of any pixel inside it is known
+# without reading it. Only the pixels of the tiles that straddle a threshold are read, block by block (like the 'window' sampling).
+# @details The levels are georeferenced like the Path Loss Map (same custom origin, see get_level_gdalinfo()), and
+# get_class_map() computes the classes of the whole map from the coarsest level, only descending into the mixed tiles.
+# @details Usage examples:
+# @code pyramid = rcs.plm_cache.get('plm_robo1.tif', 'pyramid', (10, 20, 30))
+# pyramid.get_class({'x': 120, 'y': 40})
+# classes = pyramid.get_class_map() @endcode
+class PLMPyramidRaster():
+
+    ## @brief Size (pixels) of the tiles of level 0.
+    __tile = 16
+    ## @brief Number of rows read at a time to build the pyramid (a multiple of the tile size).
+    __rows_per_read = 1024
+    ## @brief Class of the tiles whose pixels have different classes
+    mixed = 255
+
+    ## @param[in] dataset GDAL dataset of the Path Loss Map file (opened in read-only mode).
+    # @param[in] thresholds Tuple with the thresholds (t1, t2, t3) of the Path Loss Map model.
+    def __init__(self, dataset, thresholds):
+        ## @brief Dictionary with the custom origin and the geotransform of the Path Loss Map
+        self.gdalinfo = get_plm_gdalinfo(dataset)
+        ## @brief Number of columns and rows of the raster
+        self.ncols = dataset.RasterXSize
+        self.nrows = dataset.RasterYSize
+        ## @brief Tuple with the thresholds (t1, t2, t3) of the classes
+        self.thresholds = tuple(thresholds)
+        ## @brief Full resolution pixels, read only for the mixed tiles
+        self.__window = PLMWindowRaster(dataset)
+
+        tile = self.__tile
+        band = dataset.GetRasterBand(1)
+        tile_cols = -(-self.ncols // tile)
+        minimum = numpy.empty((-(-self.nrows // tile), tile_cols), dtype = numpy.float32)
+        maximum = numpy.empty(minimum.shape, dtype = numpy.float32)
+        for yoff in range(0, self.nrows, self.__rows_per_read):
+            rows = min(self.__rows_per_read, self.nrows - yoff)
+            pathlosses = band.ReadAsArray(0, yoff, self.ncols, rows)
+            stats.count('plm_bytes_read', pathlosses.nbytes)
+            # NaN pixels have the class of the negative path losses
+            pathlosses = numpy.where(numpy.isnan(pathlosses), -numpy.inf, pathlosses)
+            tiles = slice(yoff // tile, -(-(yoff + rows) // tile))
+            minimum[tiles] = self.__reduce(pathlosses, tile, numpy.minimum, numpy.inf)
+            maximum[tiles] = self.__reduce(pathlosses, tile, numpy.maximum, -numpy.inf)
+
+        ## @brief Minimum and maximum path loss of the tiles of each level (float32 Numpy arrays)
+        self.minimum = [minimum]
+        self.maximum = [maximum]
+        while max(self.minimum[-1].shape) > 1:
+            self.minimum.append(self.__reduce(self.minimum[-1], 2, numpy.minimum, numpy.inf))
+            self.maximum.append(self.__reduce(self.maximum[-1], 2, numpy.maximum, -numpy.inf))
+        ## @brief Class of the tiles of each level (uint8 Numpy arrays), or 'mixed'
+        self.classes = []
+        for low, high in zip(self.minimum, self.maximum):
+            low = bake_plm_classes(low, self.thresholds)
+            self.classes.append(numpy.where(low == bake_plm_classes(high, self.thresholds), low, self.mixed).astype(numpy.uint8))
+        ## @brief Memory used by this raster (bytes)
+        self.nbytes = sum(a.nbytes for a in self.minimum + self.maximum + self.classes) + self.__window.nbytes
+
+    ## @param[in] level Level of the pyramid (0 is the finest).
+    # @return Dictionary with the custom origin and the geotransform of the tiles of the level (the same keys of get_plm_gdalinfo()).
+    def get_level_gdalinfo(self, level):
+        gdalinfo = dict(self.gdalinfo)
+        gdalinfo['X_scale'] *= self.__tile * 2**level
+        gdalinfo['Y_scale'] *= self.__tile * 2**level
+        return gdalinfo
+
+    ## @param[in] pixel Dictionary with the pixel coordinates (x,y).
+    # @return The Data Rate class of that pixel.
+    def get_class(self, pixel):
+        c = self.classes[0][pixel['y'] // self.__tile][pixel['x'] // self.__tile]
+        if c == self.mixed:
+            stats.count('pyramid_fallbacks')
+            c = bake_plm_classes(self.__window.get_pathloss(pixel), self.thresholds)
+        return c
+
+    ## @param[in] cols Numpy array with the pixel coordinates x.
+    # @param[in] rows Numpy array with the pixel coordinates y.
+    # @return Numpy array with the Data Rate classes of those pixels.
+    def get_classes(self, cols, rows):
+        cols = numpy.asarray(cols); rows = numpy.asarray(rows)
+        # asarray: one position gives a Numpy scalar, which can not be assigned below
+        result = numpy.asarray(self.classes[0][rows // self.__tile, cols // self.__tile])
+        mixed = result == self.mixed
+        if numpy.any(mixed):
+            stats.count('pyramid_fallbacks', int(numpy.count_nonzero(mixed)))
+            result[mixed] = bake_plm_classes(self.__window.get_pathlosses(cols[mixed], rows[mixed]), self.thresholds)
+        return result
+
+    ## @param[in] floor Data Rate class of the other robot: the result is the maximum of this class and the class of each pixel,
+    # so the tiles whose classes are all below it are not visited either.
+    # @return uint8 Numpy array (rows x columns) with the maximum of floor and the Data Rate class of each pixel.
+    # @details The tiles are visited from the coarsest level: a tile is only divided if it is mixed, and only the pixels
+    # of the mixed tiles of level 0 are read.
+    def get_class_map(self, floor = 0):
+        result = numpy.empty((self.nrows, self.ncols), dtype = numpy.uint8)
+        tiles = [(len(self.classes) - 1, 0, 0)]
+        while tiles:
+            level, row, col = tiles.pop()
+            size = self.__tile * 2**level
+            window = (slice(row * size, (row + 1) * size), slice(col * size, (col + 1) * size))
+            c = self.classes[level][row][col]
+            if c != self.mixed:
+                result[window] = max(c, floor)
+            elif bake_plm_classes(self.maximum[level][row][col], self.thresholds) <= floor:
+                result[window] = floor
+            elif level > 0:
+                shape = self.classes[level - 1].shape
+                tiles.extend((level - 1, r, k) for r in range(2*row, min(2*row + 2, shape[0])) for k in range(2*col, min(2*col + 2, shape[1])))
+            else:
+                stats.count('pyramid_fallbacks')
+                pathlosses = self.__window.read(window[1].start, window[0].start, min(size, self.ncols - window[1].start), min(size, self.nrows - window[0].start))
+                result[window] = numpy.maximum(bake_plm_classes(pathlosses, self.thresholds), floor)
+        return result
+
+    ## @param[in] array 2D Numpy array.
+    # @param[in] size Size of the tiles.
+    # @param[in] function numpy.minimum or numpy.maximum.
+    # @param[in] padding Value of the pixels added to complete the tiles in the right and bottom edges.
+    # @return 2D Numpy array with the function reduced over each tile of size x size.
+    def __reduce(self, array, size, function, padding):
+        rows = -(-array.shape[0] // size); cols = -(-array.shape[1] // size)
+        padded = numpy.full((rows * size, cols * size), padding, dtype = numpy.float32)
+        padded[:array.shape[0], :array.shape[1]] = array
+        return function.reduce(function.reduce(padded.reshape(rows, size, cols, size), axis = 3), axis = 1)
+
+
+## @brief Bakes a Path Loss Map file into a Data Rate class GeoTIFF (offline).
+# @param[in] filename Path Loss Map file.
+# @param[in] thresholds Tuple with the thresholds (t1, t2, t3) of the Path Loss Map model.
+# @param[in] output Name of the uint8 GeoTIFF file to be created, with the same georeferencing and metadata.
+# @return True (False) if the file was (not) created.
+# @details The baked file can replace the original one for the 'classes' sampling, with a quarter of its size.
+def bake_plm(filename, thresholds, output):
+    dataset = gdal.Open(filename, gdalconst.GA_ReadOnly)
+    if dataset is None:
+        logger.error('Path Loss Map File "%s" could not be opened.' %filename)
+        return False
+    raster = PLMClassRaster(dataset, thresholds)
+    baked = gdal.GetDriverByName('GTiff').Create(output, raster.ncols, raster.nrows, 1, gdal.GDT_Byte)
+    if baked is None:
+        logger.error('Baked Path Loss Map File "%s" could not be created.' %output)
+        return False
+    baked.SetGeoTransform(dataset.GetGeoTransform())
+    baked.SetProjection(dataset.GetProjection())
+    metadata = dataset.GetMetadata()
+    metadata['PLM_THRESHOLDS'] = ','.join(str(t) for t in raster.thresholds)
+    baked.SetMetadata(metadata)
+    baked.GetRasterBand(1).WriteArray(raster.map_data, 0, 0)
+    baked.FlushCache()
+    baked = None; dataset = None
+    return True
+
+
+## @brief Process-wide cache of the Path Loss Map rasters, shared by all the RCS instances.
+# @details The rasters are kept by file path and sampling mode, and are reloaded when the modification time of the file changes.
+# When the memory used by the cached rasters exceeds the budget, the least recently used ones are discarded.
+# @details Usage examples:
+# @code rcs.plm_cache.set_budget(64 * 1024 * 1024)   # 64 MB
+# rcs.plm_cache.clear() @endcode
+class PLMCache():
+
+    ## @details Dictionary with the available sampling modes and the raster class used by each one.
+    # 'full' loads the whole band in memory; 'window' only reads the block containing each sampled pixel;
+    # 'classes' loads the whole map baked into Data Rate classes; 'pyramid' keeps a min/max pyramid of the classes and
+    # only reads the pixels near the thresholds (both need the thresholds of the model and give classes, not path losses).
+    __samplings = {'full': PLMRaster, 'window': PLMWindowRaster, 'classes': PLMClassRaster, 'pyramid': PLMPyramidRaster}
+
+    ## @brief Units: bytes
+    # @details Default memory budget in case it is not specified in the constructor.
+    __default_budget = 256 * 1024 * 1024
+
+    ## @param[in] budget Maximum memory (bytes) used by the cached rasters.
+    def __init__(self, budget = None):
+        ## @brief Cached rasters, from the least to the most recently used: (path, sampling, thresholds) -> (modification time, raster)
+        self.__entries = collections.OrderedDict()
+        ## @brief Units: bytes
+        self.__budget = self.__default_budget if budget is None else budget
+        ## @brief Memory currently used by the cached rasters (bytes)
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+    ## @param[in] sampling String containing the sampling mode.
+    # @return True (False) if the sampling mode exists (or not).
+    def sampling_exists(self, sampling):
+        return sampling in self.__samplings
+
+    ## @param[in] sampling String containing the sampling mode.
+    # @return True if the rasters of the sampling mode give Data Rate classes (get_class()) instead of path losses (get_pathloss()).
+    def gives_classes(self, sampling):
+        return sampling in ('classes', 'pyramid')
+
+    ## @param[in] filename Path Loss Map file.
+    # @param[in] sampling Sampling mode of the raster: 'full', 'window', 'classes' or 'pyramid'.
+    # @param[in] thresholds Tuple with the thresholds (t1, t2, t3) of the Path Loss Map model (only for the 'classes' and 'pyramid' samplings).
+    # @return The raster (PLMRaster, PLMWindowRaster, PLMClassRaster or PLMPyramidRaster) of the file, or None if it could not be opened.
+    def get(self, filename, sampling = 'full', thresholds = None):
+        if self.gives_classes(sampling):
+            key = (os.path.abspath(filename), sampling, tuple(thresholds))
+        else:
+            key = (os.path.abspath(filename), sampling, None)
+        try:
+            mtime = os.stat(key[0]).st_mtime_ns
+        except OSError:
+            return None
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if (entry is not None) and (entry[0] == mtime):
+                self.__entries.move_to_end(key)
+                stats.count('plm_cache_hits')
+                return entry[1]
+        stats.count('plm_cache_misses')
+
+        # The file is read outside the lock, so the other rasters can still be served meanwhile
+        start = stats.start()
+        dataset = gdal.Open(key[0], gdalconst.GA_ReadOnly)
+        stats.stop('gdal_open', start)
+        if dataset is None:
+            return None
+        start = stats.start()
+        if self.gives_classes(sampling):
+            raster = self.__samplings[sampling](dataset, key[2])
+        else:
+            raster = self.__samplings[sampling](dataset)
+        stats.stop('plm_load', start)
+        dataset = None
+
+        with self.__lock:
+            self.__discard(key)
+            if raster.nbytes <= self.__budget:
+                self.__entries[key] = (mtime, raster)
+                self.__size += raster.nbytes
+                self.__evict()
+            else:
+                logger.debug("PLM cache: '%s' (%i bytes) exceeds the memory budget and will not be kept" %(key[0], raster.nbytes))
+        return raster
+
+    ## @param[in] budget Maximum memory (bytes) used by the cached rasters.
+    def set_budget(self, budget):
+        with self.__lock:
+            self.__budget = budget
+            self.__evict()
+
+    ## @return The memory budget (bytes).
+    def get_budget(self):
+        return self.__budget
+
+    ## @return The memory currently used by the cached rasters (bytes).
+    def get_size(self):
+        return self.__size
+
+    ## @details Discards all the cached rasters.
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+
+    ## @param[in] key Absolute path, sampling mode and thresholds of the raster to be discarded (if cached).
+    def __discard(self, key):
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.__size -= entry[1].nbytes
+
+    ## @details Discards the least recently used rasters until the memory budget is satisfied.
+    def __evict(self):
+        while self.__entries and (self.__size > self.__budget):
+            key, entry = self.__entries.popitem(last = False)
+            self.__size -= entry[1].nbytes
+            logger.debug("PLM cache: '%s' (%s) evicted" %key[:2])
+
+
+## @brief Path Loss Map cache used by every RCS instance of this process.
+plm_cache = PLMCache()
+# --------------------------------------------------------------------------------------
+
+
+# -----------------------------MORSE CONNECTIONS ---------------------------------------
+
+## @brief Morse connection shared by several RCS instances (see MorsePool).
+# @details It gives access to the same Morse services and data streams of pymorse.Morse, and it is safe to use from several threads.
+class SharedMorse():
+
+    ## @brief Maximum number of requests waiting for the simulator at the same time (see rpc_future()).
+    __workers = 32
+
+    ## @param[in] pool MorsePool that owns this connection.
+    # @param[in] address Tuple (host, port) of the simulator.
+    def __init__(self, pool, address):
+        ## @brief Tuple (host, port) of the simulator
+        self.address = address
+        self.__pool = pool
+        ## @brief Number of users (RCS instances) of this connection
+        self.references = 0
+        self.__morse = pymorse.Morse(*address)
+        self.__lock = threading.Lock()
+        ## @brief Threads that wait for the concurrent requests (created on the first one)
+        self.__executor = None
+
+    ## @brief Calls a service from the simulator (blocking).
+    # @details pymorse matches each response with the id of its request, so only the allocation of the id
+    # has to be serialised: requests from different threads are sent and answered concurrently.
+    def rpc(self, component, service, *args):
+        start = stats.start()
+        with self.__lock:
+            request = self.__morse._rpc_request(component, service, *args)
+        result = self.__morse._rpc_process(request)
+        stats.stop('rpc', start)
+        return result
+
+    ## @brief Calls a service from the simulator without blocking.
+    # @return A concurrent.futures.Future with the result of the service.
+    def rpc_future(self, component, service, *args):
+        start = stats.start()
+        with self.__lock:
+            request = self.__morse._rpc_request(component, service, *args)
+        future = self.submit(self.__morse._rpc_process, request)
+        if start is not None:
+            future.add_done_callback(lambda future: stats.stop('rpc', start))
+        return future
+
+    ## @brief Runs a blocking call (e.g. the get() of a data stream) in the threads of this connection.
+    # @return A concurrent.futures.Future with the result of the call.
+    def submit(self, function, *args):
+        with self.__lock:
+            if self.__executor is None:
+                # Imported here: it is only needed by the concurrent requests
+                import concurrent.futures
+                self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers = self.__workers)
+        return self.__executor.submit(function, *args)
+
+    ## @param[in] robot Name of the robot.
+    # @param[in] name Name of the component (e.g. the Pose sensor).
+    # @return The pymorse component, with its data stream already opened.
+    def get_component(self, robot, name):
+        # The data stream of a component is opened on its first access
+        with self.__lock:
+            return getattr(getattr(self.__morse, robot), name)
+
+    ## @details Releases this connection: the socket is only closed when it is no longer used.
+    def close(self):
+        self.__pool.release(self)
+
+    ## @details Closes the socket (used by the MorsePool).
+    def shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait = True)
+        self.__morse.close()
+
+
+## @brief Pool of Morse connections, shared by all the RCS instances of this process.
+# @details Each RCS instance acquires a connection in its constructor and releases it in its destructor:
+# there is a single connection per simulator (host, port), which is closed when its last user releases it.
+# @note pymorse.Morse.close() closes every pymorse socket of the process, so separate connections to the same simulator cannot be closed independently anyway.
+class MorsePool():
+
+    def __init__(self):
+        ## @brief Open connections: (host, port) -> SharedMorse
+        self.__connections = {}
+        self.__lock = threading.Lock()
+
+    ## @param[in] host Host of the simulator.
+    # @param[in] port Port of the simulator socket interface.
+    # @return The SharedMorse connection to the simulator (it is opened if needed).
+    def acquire(self, host = "localhost", port = 4000):
+        with self.__lock:
+            connection = self.__connections.get((host, port))
+            if connection is None:
+                connection = SharedMorse(self, (host, port))
+                self.__connections[(host, port)] = connection
+                logger.info('Morse socket opened')
+            connection.references += 1
+            return connection
+
+    ## @param[in] connection SharedMorse connection previously given by acquire().
+    def release(self, connection):
+        with self.__lock:
+            connection.references -= 1
+            if connection.references > 0:
+                return
+            del self.__connections[connection.address]
+        connection.shutdown()
+        logger.info('Morse socket closed')
+
+    ## @return The number of connections currently opened.
+    def get_size(self):
+        return len(self.__connections)
+
+
+## @brief Morse connections used by every RCS instance of this process.
+morse_pool = MorsePool()
+# --------------------------------------------------------------------------------------
+
+
+# -----------------------------MORSE SNAPSHOT ------------------------------------------
+
+## @brief Snapshot of the data read from Morse (poses and 'distance_and_view' results), shared by all the RCS instances.
+# @details Within a tick, each pose and each pair of robots is only read once: the other models and RCS instances
+# reuse the same data, which also keeps their results consistent. A tick ends when tick() is called (frame-based)
+# and/or when the data is older than the maximum age (time-based).
+# @details Usage examples:
+# @code rcs.snapshot.set_max_age(0.1)     # data can be reused during 100 ms
+# ...
+# rcs.snapshot.set_max_age(None)    # data can be reused until the next tick
+# while True:
+#     rcs.snapshot.tick()
+#     r1r2_1.can_communicate(); r1r2_2.can_communicate()      # Morse is only read once @endcode
+# @note The default maximum age is 0: the data is always read again, as if there was no snapshot.
+class MorseSnapshot():
+
+    ## @param[in] max_age Units: seconds. None means that the data is kept until the next tick().
+    def __init__(self, max_age = 0.0):
+        ## @brief Data read in the current tick: key -> (time, value)
+        self.__entries = {}
+        ## @brief Units: seconds
+        self.__max_age = max_age
+        self.__lock = threading.Lock()
+
+    ## @param[in] max_age Units: seconds. None means that the data is kept until the next tick().
+    def set_max_age(self, max_age):
+        with self.__lock:
+            self.__max_age = max_age
+            self.__entries.clear()
+
+    ## @return The maximum age (seconds) of the data, or None if it is kept until the next tick().
+    def get_max_age(self):
+        return self.__max_age
+
+    ## @details Starts a new tick: all the data will be read again.
+    def tick(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    ## @param[in] key Key of the data (see get_pose() and get_distance_and_view()).
+    # @return The data of the current tick, or None if it was not read yet (or it is too old).
+    def lookup(self, key):
+        if self.__max_age == 0:
+            return None
+        with self.__lock:
+            entry = self.__entries.get(key)
+        if (entry is None) or ((self.__max_age is not None) and (time.monotonic() - entry[0] > self.__max_age)):
+            return None
+        return entry[1]
+
+    ## @param[in] key Key of the data.
+    # @param[in] value Data read from Morse.
+    def store(self, key, value):
+        if (self.__max_age == 0) or (value is None):
+            return
+        with self.__lock:
+            self.__entries[key] = (time.monotonic(), value)
+
+    ## @param[in] key Key of the data.
+    # @param[in] read Function that reads the data from Morse, if needed.
+    # @return The data of the current tick.
+    def get(self, key, read, *args):
+        value = self.lookup(key)
+        if value is None:
+            stats.count('snapshot_misses')
+            value = read(*args)
+            self.store(key, value)
+        else:
+            stats.count('snapshot_hits')
+        return value
+
+    ## @param[in] connection SharedMorse connection.
+    # @param[in] robot Name of the robot.
+    # @param[in] sensor Name of its Pose sensor.
+    # @return Key of the pose of the robot.
+    def pose_key(self, connection, robot, sensor):
+        return ('pose', connection.address, robot, sensor)
+
+    ## @param[in] connection SharedMorse connection.
+    # @param[in] r1 Name of one robot.
+    # @param[in] r2 Name of the other robot.
+    # @return Key of the 'distance_and_view' result of the pair (the same for both orders of the robots).
+    def distance_and_view_key(self, connection, r1, r2):
+        return ('distance_and_view', connection.address) + tuple(sorted((r1, r2)))
+
+    ## @param[in] connection SharedMorse connection.
+    # @param[in] robot Name of the robot.
+    # @param[in] sensor Name of its Pose sensor.
+    # @return The data of the Pose sensor (one read per robot and tick).
+    def get_pose(self, connection, robot, sensor):
+        return self.get(self.pose_key(connection, robot, sensor), self.__read_pose, connection, robot, sensor)
+
+    ## @param[in] connection SharedMorse connection.
+    # @param[in] r1 Name of one robot.
+    # @param[in] r2 Name of the other robot.
+    # @return A list with 2 arguments: distance between the 2 robots, line-of-sight (boolean) (one request per pair and tick).
+    def get_distance_and_view(self, connection, r1, r2):
+        return self.get(self.distance_and_view_key(connection, r1, r2), connection.rpc, 'communication', 'distance_and_view', r1, r2)
+
+    ## @param[in] connection SharedMorse connection.
+    # @param[in] robot Name of the robot.
+    # @param[in] sensor Name of its Pose sensor.
+    # @return The data of the Pose sensor, read from Morse.
+    def __read_pose(self, connection, robot, sensor):
+        start = stats.start()
+        pose = connection.get_component(robot, sensor).get()
+        stats.stop('pose', start)
+        return pose
+
+
+## @brief Snapshot used by every RCS instance of this process.
+snapshot = MorseSnapshot()
+# --------------------------------------------------------------------------------------
+
+
+# -----------------------------BATCH EVALUATION ----------------------------------------
+# Vectorized versions of the RCS models, for offline replays and parameter sweeps.
+# They take Numpy arrays (or anything numpy.asarray() accepts) and return Numpy arrays of the same length.
+# @details Usage examples:
+# @code d = rcs.batch_distance(positions_r1, positions_r2)          # N x 3 (or N x 2) arrays
+# links = rcs.batch_distance_model(d, distance_threshold = 15)
+# links = rcs.batch_free_space_loss_model(d, freq = 750, free_space_threshold = 55)
+# rates = rcs.batch_plm_model(positions_r1, positions_r2, 'plm_robo1.tif', 'plm_robo2.tif', parameters) @endcode
+
+## @param[in] positions_1 Array (N x 2 or N x 3) with the positions of one robot.
+# @param[in] positions_2 Array (N x 2 or N x 3) with the positions of the other robot.
+# @return Array with the N distances between the robots (meters).
+def batch_distance(positions_1, positions_2):
+    delta = numpy.asarray(positions_1, dtype = float) - numpy.asarray(positions_2, dtype = float)
+    return numpy.sqrt((delta * delta).sum(axis = -1))
+
+## @param[in] distances Array with the distances between the robots (meters).
+# @param[in] distance_threshold In Morse: 1 unit --> 1 meter
+# @return Array: 1 (0) where the distance is less (greater or equal) than the threshold.
+def batch_distance_model(distances, distance_threshold):
+    return (numpy.asarray(distances) < distance_threshold).astype(int)
+
+## @param[in] distances Array with the distances between the robots (meters).
+# @param[in] freq Units: MHz
+# @return Array with the free space path losses (dB).
+# @details Same formula of FreeSpaceLossModel (@cite paper_2002). A distance of 0 gives -inf.
+def batch_free_space_loss(distances, freq):
+    Gt = 2; Gr = 2; c = 299792458;
+    wavelength = c/(freq*1e6)
+    with numpy.errstate(divide = 'ignore'):
+        return -10*numpy.log10((Gt*Gr*wavelength**2)/numpy.square(4*numpy.pi*numpy.asarray(distances, dtype = float)))
+
+## @param[in] distances Array with the distances between the robots (meters).
+# @param[in] freq Units: MHz
+# @param[in] free_space_threshold Units: dB
+# @return Array: 1 (0) where the path loss is less (greater or equal) than the threshold.
+def batch_free_space_loss_model(distances, freq, free_space_threshold):
+    return (batch_free_space_loss(distances, freq) < free_space_threshold).astype(int)
+
+## @param[in] freq Units: MHz
+# @param[in] free_space_threshold Units: dB
+# @return The distance (meters) at which the free space path loss reaches the threshold (inverse of batch_free_space_loss()):
+# the robots can communicate if, and only if, they are closer than this distance.
+def free_space_loss_distance(freq, free_space_threshold):
+    Gt = 2; Gr = 2; c = 299792458;
+    wavelength = c/(freq*1e6)
+    return wavelength/(4*math.pi) * math.sqrt(Gt*Gr) * math.pow(10, free_space_threshold/20.0)
+
+## @param[in] pathlosses Array with the maximum path loss of each pair of robots.
+# @param[in] plm Dictionary with the parameters of the Path Loss Map model (see RCS.check_plm_dictionary()).
+# @return Array with the Data Rates (Mb/s).
+# @details Same conditions of PLMModel: negative (or NaN) path losses have a Data Rate of 0.
+def batch_data_rate(pathlosses, plm):
+    pathlosses = numpy.asarray(pathlosses)
+    data_rates = numpy.array([plm['dr0'], plm['dr1'], plm['dr2'], plm['dr3']])
+    result = data_rates[numpy.digitize(pathlosses, [plm['t1'], plm['t2'], plm['t3']])]
+    return numpy.where(pathlosses >= 0, result, 0)
+
+## @param[in] gdalinfo Dictionary with the custom origin and the geotransform of a Path Loss Map (see get_plm_gdalinfo()).
+# @param[in] morse_pose Dictionary with the coordinates x,y given by morse.
+# @return Dictionary with the pixel coordinates (x,y) to read the path loss in the raster.
+def get_pixel_coordinates(gdalinfo, morse_pose):
+
+    # Convert Morse Pose coordinates to Morse Pose UTM coordinates
+    x = float(morse_pose['x'] + gdalinfo['X_custom_origin'])
+    y = float(morse_pose['y'] + gdalinfo['Y_custom_origin'])
+
+    # Convert UTM to Pixel
+    p = {}
+    p['x'] = int((x - gdalinfo['X_utm_origin']) / gdalinfo['X_scale'])
+    p['y'] = int((y - gdalinfo['Y_utm_origin']) / gdalinfo['Y_scale'])
+    return p
+
+## @param[in] gdalinfo Dictionary with the custom origin and the geotransform of a Path Loss Map (see get_plm_gdalinfo()).
+# @param[in] positions Array (N x 2 or N x 3) with the Morse coordinates of the robots.
+# @return Tuple with 2 integer arrays: the pixel coordinates x (columns) and y (rows).
+# @details Same conversion of get_pixel_coordinates().
+def batch_pixel_coordinates(gdalinfo, positions):
+    positions = numpy.asarray(positions, dtype = float)
+    # Morse Pose --> UTM --> Pixel (truncated like int())
+    cols = ((positions[..., 0] + gdalinfo['X_custom_origin'] - gdalinfo['X_utm_origin']) / gdalinfo['X_scale']).astype(int)
+    rows = ((positions[..., 1] + gdalinfo['Y_custom_origin'] - gdalinfo['Y_utm_origin']) / gdalinfo['Y_scale']).astype(int)
+    return cols, rows
+
+## @param[in] filename Path Loss Map file.
+# @param[in] positions Array (N x 2 or N x 3) with the Morse coordinates of the robot.
+# @param[in] sampling Sampling mode of the raster (see PLMCache).
+# @return Array with the path losses under the robot.
+# @exception Exit if the Path Loss Map file could not be opened.
+def batch_pathloss(filename, positions, sampling = 'full'):
+    raster = plm_cache.get(filename, sampling)
+    if raster is None:
+        logger.error('\n\nPath Loss Map File "%s" could not be opened.\nBye...\n\n' %filename)
+        sys.exit(1)
+    return raster.get_pathlosses(*batch_pixel_coordinates(raster.gdalinfo, positions))
+
+## @param[in] filename Path Loss Map file.
+# @param[in] positions Array (N x 2 or N x 3) with the Morse coordinates of the robot.
+# @param[in] plm Dictionary with the parameters of the Path Loss Map model.
+# @param[in] sampling 'classes' or 'pyramid' (see PLMCache).
+# @return uint8 array with the Data Rate classes under the robot (see bake_plm_classes()).
+# @exception Exit if the Path Loss Map file could not be opened.
+def batch_plm_classes(filename, positions, plm, sampling = 'classes'):
+    raster = plm_cache.get(filename, sampling, (plm['t1'], plm['t2'], plm['t3']))
+    if raster is None:
+        logger.error('\n\nPath Loss Map File "%s" could not be opened.\nBye...\n\n' %filename)
+        sys.exit(1)
+    return raster.get_classes(*batch_pixel_coordinates(raster.gdalinfo, positions))
+
+## @param[in] positions_1 Array (N x 2 or N x 3) with the positions of one robot.
+# @param[in] positions_2 Array (N x 2 or N x 3) with the positions of the other robot.
+# @param[in] filename_1 Path Loss Map file of one robot ('plm_'+robotname+'.tif').
+# @param[in] filename_2 Path Loss Map file of the other robot.
+# @param[in] plm Dictionary with the parameters of the Path Loss Map model.
+# @param[in] sampling Sampling mode of the rasters (see PLMCache).
+# @return Array with the Data Rates (Mb/s), according to the maximum path loss of each pair of positions.
+def batch_plm_model(positions_1, positions_2, filename_1, filename_2, plm, sampling = 'full'):
+    if plm_cache.gives_classes(sampling):
+        return get_plm_rate_table(plm)[batch_plm_classes(filename_1, positions_1, plm, sampling), batch_plm_classes(filename_2, positions_2, plm, sampling)]
+    pathlosses = numpy.maximum(batch_pathloss(filename_1, positions_1, sampling), batch_pathloss(filename_2, positions_2, sampling))
+    return batch_data_rate(pathlosses, plm)
+# --------------------------------------------------------------------------------------
+
+# -----------------------------COMMUNICATION MODELS ------------------------------------
+
+## @brief Base class of the communication models of RCS (see ModelRegistry).
+# @details A model declares the inputs it needs (a subset of INPUTS), so RCS, rcs_network.RCSNetwork and rcs_trace.TraceReplay
+# only read those from Morse (or from the trace). The specifications (spec) are the dictionaries of RCS.get_specifications().
+# @details The inputs of evaluate() (one pair of robots) are a dictionary with:
+# - 'robots': tuple with the names of the 2 robots (always given),
+# - 'distance' (meters) and 'line_of_sight' (boolean): from the 'distance_and_view' service, or from a local line-of-sight engine,
+# - 'poses': dictionary {'r1': pose, 'r2': pose} with the data of the Pose sensors,
+# - 'rasters': dictionary {'r1': raster, 'r2': raster} with the Path Loss Map rasters of the robots ('plm_'+robotname+'.tif', see PLMCache).
+# @details The inputs of batch_evaluate() (P pairs of robots) are a dictionary with:
+# - 'robots': list with the names of the N robots and 'pairs': tuple (i, j) with the indices of the robots of each pair (always given),
+# - 'distance' and 'line_of_sight': arrays (P) of each pair,
+# - 'positions': array (N x 3) with the positions x,y,z of the robots (given for 'poses' and 'rasters').
+# All the arrays may have leading dimensions (e.g. the ticks of a trace: ticks x P, ticks x N x 3).
+# @details Usage examples (a new model, registered without changing rcs.py):
+# @code class LogDistanceModel(rcs.CommunicationModel):
+#     name = 'log_distance'
+#     inputs = ('distance',)
+#     defaults = {'exponent': 2.7, 'loss_threshold': 80}
+#     def evaluate(self, spec, inputs):
+#         return int(self.batch_evaluate(spec, inputs))
+#     def batch_evaluate(self, spec, inputs):
+#         loss = rcs.batch_free_space_loss(1, spec['freq']) + 10*spec['exponent']*rcs.numpy.log10(inputs['distance'])
+#         return (loss < spec['loss_threshold']).astype(int)
+# rcs.models.register(LogDistanceModel())
+# r1r2 = rcs.RCS('robo1', 'robo2', model = 'log_distance', exponent = 3) @endcode
+class CommunicationModel():
+
+    ## @brief Inputs that a model can declare.
+    INPUTS = ('distance', 'line_of_sight', 'poses', 'rasters')
+    ## @brief Name of the model (the 'model' specification)
+    name = None
+    ## @brief Tuple with the inputs needed by the model
+    inputs = ()
+    ## @brief Dictionary with the specifications added by the model and their default values
+    defaults = {}
+
+    ## @param[in] spec Dictionary with the model specifications.
+    # @param[in] inputs Dictionary with the inputs of one pair of robots. The model may add intermediate values to it, for explain().
+    # @return The result of the pair (the same of RCS.can_communicate()).
+    def evaluate(self, spec, inputs):
+        raise NotImplementedError
+
+    ## @param[in] spec Dictionary with the model specifications.
+    # @param[in] inputs Dictionary with the inputs of the pairs of robots.
+    # @return Numpy array with the result of each pair.
+    def batch_evaluate(self, spec, inputs):
+        raise NotImplementedError
+
+    ## @param[in] spec Dictionary with the model specifications.
+    # @return Function evaluate(inputs) for these specifications, resolved once by RCS.set_model_specifications().
+    # @details Models with values that only depend on the specifications can compute them here, once.
+    def bind(self, spec):
+        return lambda inputs: self.evaluate(spec, inputs)
+
+    ## @param[in] spec Dictionary with the model specifications.
+    # @param[in] inputs Dictionary with the inputs given to evaluate().
+    # @param[in] result Result of evaluate().
+    # @return String with the result, logged after the names of the robots (e.g. "can communicate, because ...").
+    def explain(self, spec, inputs, result):
+        return "have a result of %s" %result
+
+    ## @param[in] spec Dictionary with the model specifications.
+    # @return String with the model and its specifications (see RCS.get_model_specifications()).
+    def describe(self, spec):
+        return "Model: %s;   Parameters: %s" %(self.name, dict((key, spec.get(key)) for key in self.defaults))
+
+    ## @param[in] spec Dictionary with the model specifications.
+    # @return The distance (meters) below which 2 robots can communicate, or None if the model does not depend only on the distance.
+    # @note Only models whose single input is 'distance' can have a cutoff distance.
+    def get_cutoff_distance(self, spec):
+        return None
+
+
+## @brief The robots can communicate if they are closer than 'distance_threshold' (meters).
+class DistanceModel(CommunicationModel):
+
+    name = 'distance'
+    inputs = ('distance',)
+
+    def evaluate(self, spec, inputs):
+        return 1 if inputs['distance'] < spec['distance_threshold'] else 0
+
+    def batch_evaluate(self, spec, inputs):
+        return batch_distance_model(inputs['distance'], spec['distance_threshold'])
+
+    def explain(self, spec, inputs, result):
+        if result:
+            return "can communicate, because DISTANCE is: %i (<%i)" %(inputs['distance'], spec['distance_threshold'])
+        return "CANNOT communicate, because DISTANCE is: %i (>=%i)" %(inputs['distance'], spec['distance_threshold'])
+
+    def describe(self, spec):
+        return "Model: Distance;   Threshold: " + str(spec['distance_threshold'])
+
+    def get_cutoff_distance(self, spec):
+        return spec['distance_threshold']
+
+
+## @brief The robots can communicate if they are in line-of-sight.
+class LineOfSightModel(CommunicationModel):
+
+    name = 'line_of_sight'
+    inputs = ('line_of_sight',)
+
+    def evaluate(self, spec, inputs):
+        return 1 if inputs['line_of_sight'] else 0
+
+    def batch_evaluate(self, spec, inputs):
+        return numpy.asarray(inputs['line_of_sight']).astype(int)
+
+    def explain(self, spec, inputs, result):
+        if result:
+            return "can communicate, because LINE-of-SIGHT is: %s" %inputs['line_of_sight']
+        return "CANNOT communicate, because LINE-of-SIGHT is: %s" %inputs['line_of_sight']
+
+    def describe(self, spec):
+        return "Model: Line of Sight"
+
+
+## @brief The robots can communicate if the free space path loss at 'freq' (MHz) is less than 'free_space_threshold' (dB).
+# @details Formula obtained from @cite paper_2002.
+# @todo When the robot antennas will be defined on Morse, then get the gain Gt and Gr
+class FreeSpaceLossModel(CommunicationModel):
+
+    name = 'free_space_loss'
+    inputs = ('distance',)
+
+    def evaluate(self, spec, inputs):
+        Gt = 2; Gr = 2; c = 299792458;
+        wavelength = float(c/(spec['freq']*math.pow(10, 6)))
+        inputs['loss'] = loss = float(-10*math.log10((Gt*Gr*math.pow(wavelength, 2))/math.pow(4*math.pi*inputs['distance'], 2)))
+        return 1 if loss < spec['free_space_threshold'] else 0
+
+    def batch_evaluate(self, spec, inputs):
+        return batch_free_space_loss_model(inputs['distance'], spec['freq'], spec['free_space_threshold'])
+
+    def explain(self, spec, inputs, result):
+        if result:
+            return "can communicate, because FREE SPACE LOSS is: %i (<%i)" %(inputs['loss'], spec['free_space_threshold'])
+        return "CANNOT communicate, because FREE SPACE LOSS is: %i (>=%i)" %(inputs['loss'], spec['free_space_threshold'])
+
+    def describe(self, spec):
+        return "Model: Free Space Loss;   Threshold: " + str(spec['free_space_threshold']) \
+                + "(dB)   Frequency: " + str(spec['freq']) + "(MHz)"
+
+    def get_cutoff_distance(self, spec):
+        return free_space_loss_distance(spec['freq'], spec['free_space_threshold'])
+
+
+## @brief The result is the Data Rate (Mb/s) of the maximum path loss of the 2 robots in their Path Loss Maps ('plm' parameters).
+# @details The rasters are sampled with the 'plm_sampling' mode (see PLMCache). With the samplings that give Data Rate classes,
+# the Data Rate is taken from the maximum class of the 2 robots (see bake_plm_classes()).
+# @details batch_evaluate() also accepts the input 'pathloss' (array with the maximum path loss of each pair, e.g. recorded
+# by rcs_trace.TraceRecorder) instead of sampling the rasters.
+class PLMModel(CommunicationModel):
+
+    name = 'plm'
+    inputs = ('poses', 'rasters')
+
+    def evaluate(self, spec, inputs):
+        plm = spec['plm']
+        classes = plm_cache.gives_classes(spec['plm_sampling'])
+        values = []
+        for key in ('r1', 'r2'):
+            start = stats.start()
+            raster = inputs['rasters'][key]
+            pixel = get_pixel_coordinates(raster.gdalinfo, inputs['poses'][key])
+            values.append(raster.get_class(pixel) if classes else raster.get_pathloss(pixel))
+            stats.stop('plm_lookup', start)
+
+        if classes:
+            inputs['class'] = c = max(values)
+            result = (0, plm['dr0'], plm['dr1'], plm['dr2'], plm['dr3'])[c]
+            if c == 0:
+                logger.error("\n\nRCS: The maximum path loss between the robots "\
+                        + str(inputs['robots'][0].upper()) + ' & ' + str(inputs['robots'][1].upper())\
+                        + " is < 0.\nThere is no data rate condition to deal with this case (< 0).\n\n")
+            return result
+
+        inputs['pathloss'] = pl = max(values)
+        if (pl >= 0) and (pl < plm['t1']):
+            result = plm['dr0']
+        elif (pl >= plm['t1']) and (pl < plm['t2']):
+            result = plm['dr1']
+        elif (pl >= plm['t2']) and (pl < plm['t3']):
+            result = plm['dr2']
+        elif pl >= plm['t3']:
+            result = plm['dr3']
+        else:
+            logger.error("\n\nRCS: The maximum path loss between the robots "\
+                    + str(inputs['robots'][0].upper()) + ' & ' + str(inputs['robots'][1].upper())\
+                    + ' is ' + str(pl) + ".\nThere is no data rate condition to deal with this case (< 0).\n\n")
+            result = 0
+        return result
+
+    def batch_evaluate(self, spec, inputs):
+        plm = spec['plm']
+        i, j = inputs['pairs']
+        if 'pathloss' in inputs:
+            return batch_data_rate(inputs['pathloss'], plm)
+
+        # The Path Loss Map of each robot is sampled once, for all its pairs
+        sampling = spec['plm_sampling']
+        positions = inputs['positions']
+        if plm_cache.gives_classes(sampling):
+            classes = numpy.stack([batch_plm_classes('plm_'+robot+'.tif', positions[..., k, :], plm, sampling)
+                                   for k, robot in enumerate(inputs['robots'])], axis = -1)
+            return get_plm_rate_table(plm)[classes[..., i], classes[..., j]]
+        pathlosses = numpy.stack([batch_pathloss('plm_'+robot+'.tif', positions[..., k, :], sampling)
+                                  for k, robot in enumerate(inputs['robots'])], axis = -1)
+        return batch_data_rate(numpy.maximum(pathlosses[..., i], pathlosses[..., j]), plm)
+
+    def explain(self, spec, inputs, result):
+        if inputs.get('class') == 0:
+            return "have a Data Rate communication of %.2f (Mb/s), because the maximum Path Loss is < 0" %result
+        if 'class' in inputs:
+            limits = [0, spec['plm']['t1'], spec['plm']['t2'], spec['plm']['t3'], float('inf')]
+            c = inputs['class']
+            return "have a Data Rate communication of %.2f (Mb/s), because the maximum Path Loss is in: [%s, %s[" %(result, limits[c-1], limits[c])
+        return "have a Data Rate communication of %.2f (Mb/s), because the maximum Path Loss is: %.2f" %(result, inputs['pathloss'])
+
+    def describe(self, spec):
+        return "Model: Path Loss Map;   Parameters: " + str(spec['plm']) + "   Sampling: " + spec['plm_sampling']
+
+
+## @brief Explanation of the result of a model, given to the log records of RCS: it is only formatted (see CommunicationModel.explain())
+# if the record is written, so the queries do not pay for the records dropped by the level or by PairLogFilter.
+class LazyExplanation():
+
+    __slots__ = ('model', 'spec', 'inputs', 'result')
+
+    def __init__(self, model, spec, inputs, result):
+        self.model = model
+        self.spec = spec
+        self.inputs = inputs
+        self.result = result
+
+    def __str__(self):
+        return self.model.explain(self.spec, self.inputs, self.result)
+
+
+## @brief Registry of the communication models available to RCS, rcs_network.RCSNetwork and rcs_trace.TraceReplay.
+# @details The models 'distance', 'line_of_sight', 'free_space_loss' and 'plm' are registered when rcs is imported.
+# Other models (see CommunicationModel) can be registered by any module, and used by their name in the 'model' specification.
+class ModelRegistry():
+
+    def __init__(self):
+        ## @brief Dictionary: name --> CommunicationModel
+        self.__models = collections.OrderedDict()
+
+    ## @param[in] model CommunicationModel instance. A model with the same name is replaced.
+    # @exception ValueError if the model has no name or declares unknown inputs (an error of the module of the model, so the caller can handle it).
+    def register(self, model):
+        unknown = [name for name in model.inputs if name not in CommunicationModel.INPUTS]
+        if (not model.name) or unknown:
+            raise ValueError('The communication model "%s" could not be registered (unknown inputs: %s)' %(model.name, unknown))
+        self.__models[model.name.lower()] = model
+
+    ## @param[in] name Name of the model.
+    # @return The model (CommunicationModel), or None if it was not registered.
+    def get(self, name):
+        return self.__models.get(name.lower())
+
+    ## @param[in] name Name of the model.
+    # @return True (False) if the model is (not) registered.
+    def exists(self, name):
+        return name.lower() in self.__models
+
+    ## @return List with the names of the registered models.
+    def names(self):
+        return list(self.__models)
+
+    ## @return Dictionary with the specifications added by the registered models and their default values.
+    def get_defaults(self):
+        defaults = {}
+        for model in self.__models.values():
+            defaults.update(model.defaults)
+        return defaults
+
+
+## @brief Registry of the communication models (see ModelRegistry).
+models = ModelRegistry()
+for model in (DistanceModel(), LineOfSightModel(), FreeSpaceLossModel(), PLMModel()):
+    models.register(model)
+del model
 # --------------------------------------------------------------------------------------
 
 
@@ -40,8 +1457,6 @@ logger.addHandler(ch)
 # @author Paulo Simões
 class RCS():
     
-    ## @details Tuple including all the communication models available in this module.
-    __models = ('distance', 'line_of_sight', 'free_space_loss', 'plm')
     ## @details Default communication model in case it is not specified in the constructor or set_model_specifications() method.
     __default_model = 'distance'
     ## @brief In Morse: 1 unit --> 1 meter
@@ -55,8 +1470,12 @@ class RCS():
     __default_free_space_threshold = 45
     ## @brief Dictionary including the default parameters of the Path Loss Map model.
     # @details These values are established in case they are wrongly (or not) specified in the constructor or set_model_specifications() method.
-    # @see __check_plm_dictionary()
+    # @see check_plm_dictionary()
     __default_plm = {'t1':20, 't2':40, 't3':60, 'dr0':54, 'dr1':42, 'dr2':27, 'dr3':0}
+    ## @brief Sampling mode of the Path Loss Map rasters: 'full', 'window', 'classes' or 'pyramid'
+    # @details Default sampling mode in case it is not specified in the constructor or set_model_specifications() method.
+    # @see PLMCache
+    __default_plm_sampling = 'full'
     
     
     ## @param[in] robot_1 Name of one robot.
@@ -72,16 +1491,18 @@ class RCS():
     # ...
     # parameters = {'t1':10, 't2':20, 't3':30, 'dr0':4, 'dr1':3, 'dr2':2, 'dr3':1}
     # r1r2_4 = rcs.RCS('robo1', 'robo2', model = 'plm', plm = parameters)
+    # r1r2_5 = rcs.RCS('robo1', 'robo2', model = 'plm', plm_sampling = 'window')
     # ...
 	# r0r1 = rcs.RCS('r0', 'r1', model = "free_space_loss", freq = 800, free_space_threshold = 120)
 	# r0r1 = rcs.RCS('r0', 'r1', model = "distance", free_space_threshold = 100) @endcode
 	# Of course, the last example doesn't make sense because the model 'distance' is not related with the loss threshold.
 	# So, this method has to be used consciously.
-	# @see Available models: __models
+	# @see Available models: ModelRegistry
     def __init__(self, robot_1, robot_2, **kwargs):
 
         ## @brief Morse connection: access to Morse services and data streams
-        self.__morse = pymorse.Morse()
+        # @details The connection is shared with the other RCS instances (see MorsePool).
+        self.__morse = morse_pool.acquire()
         ## @brief Dictionary with the names of the 2 robots and also the names of their respective Pose sensors
         self.__robot_names = self.__verify_robots_names_and_pose_sensors(robot_1, robot_2)
         ## @brief Name of the communication model applied between the 2 robots
@@ -93,30 +1514,95 @@ class RCS():
         ## @brief Units: dB
         self.__free_space_threshold = None
         ## @brief Path Loss Map parameters (dictionary)
-        # @see The mandatory conditions that are checked in this dictionary at __check_plm_dictionary()
+        # @see The mandatory conditions that are checked in this dictionary at check_plm_dictionary()
         self.__plm = None
+        ## @brief Sampling mode of the Path Loss Map rasters
+        # @see PLMCache
+        self.__plm_sampling = None
+        ## @brief Local line-of-sight engine used instead of the 'distance_and_view' service (None: the service is used)
+        # @see rcs_los.DSMLineOfSight
+        self.__los = None
+        ## @brief Specifications added by the registered models (see CommunicationModel.defaults)
+        self.__parameters = {}
+        ## @brief Communication model (CommunicationModel) and its specifications, resolved by set_model_specifications()
+        self.__model_object = None
+        self.__spec = None
+        ## @brief Function evaluate(inputs) of the model, bound to its specifications (see CommunicationModel.bind())
+        self.__model_evaluate = None
+        ## @brief Data read from Morse for the model: 'poses' and/or 'distance_and_view' (see get_required_inputs())
+        self.__required_inputs = ()
+        ## @brief Inputs of the model (see CommunicationModel.INPUTS): distance and line-of-sight, poses, rasters
+        self.__needs = (False, False, False)
+        ## @brief Time series of the results (opt-in, see set_history())
+        self.__history = None
         
         self.set_model_specifications(**kwargs)
         
-    ## @details This method closes the connection with the  morse simulation.
+    ## @details This method releases the connection with the  morse simulation (it is closed by its last user).
     def __del__(self):
         self.__morse.close()
-        logger.info('Morse socket closed')        
 
     ## @return 1 (0) if the 2 robots can (cannot) communicate according to the established communication model.
     # @exception For the Path Loss Map model, it returns the Data Rate (Mb/s). 
+    # @exception None if the 'distance_and_view' service failed (the error is logged).
     def can_communicate(self):
-        if self.__model == 'distance':
-            return self.__simulate_comm_distance()
-        elif self.__model == 'line_of_sight':
-            return self.__simulate_comm_lineofsight()
-        elif self.__model == 'free_space_loss':
-            return self.__simulate_comm_freespaceloss()
-        elif self.__model == 'plm':
-            return self.__simulate_comm_pathlossmap()
-        else:
-            logger.debug("An error occurred in the 'Class -> RCS.can_communicate() method.")
-            return 0
+        start = stats.start()
+        poses = self.__get_poses() if 'poses' in self.__required_inputs else None
+        distance_and_view = self.__get_distance_and_lineofsight() if 'distance_and_view' in self.__required_inputs else None
+        result = self.evaluate(distance_and_view = distance_and_view, poses = poses)
+        stats.stop('can_communicate.' + self.__model, start)
+        return result
+
+    ## @return Tuple with the data that must be read from Morse for the established model (see CommunicationModel.inputs):
+    # 'poses' for the data of the Pose sensors (inputs 'poses' and 'rasters', or a local line-of-sight engine),
+    # and/or 'distance_and_view' for the 'distance_and_view' service of Morse (inputs 'distance' and 'line_of_sight').
+    def get_required_inputs(self):
+        return self.__required_inputs
+
+    ## @brief This method applies the established communication model to data already read from Morse.
+    # @param[in] distance_and_view List [distance, line-of-sight] given by the 'distance_and_view' service (models with the inputs 'distance' or 'line_of_sight').
+    # @param[in] poses Dictionary {'r1': pose, 'r2': pose} with the data of the Pose sensors of the 2 robots (models with the inputs 'poses' or 'rasters', or a local line-of-sight engine).
+    # @return The same result of can_communicate(), or None if distance_and_view is needed but missing (e.g. the 'distance_and_view' service failed).
+    # @details It allows the data to be read in other ways (e.g. concurrently, see @ref rcs_async.AsyncRCS).
+    # @see get_required_inputs()
+    def evaluate(self, distance_and_view = None, poses = None):
+        needs_view, needs_poses, needs_rasters = self.__needs
+        inputs = {'robots': (self.__robot_names['r1'], self.__robot_names['r2'])}
+        if needs_view:
+            if (distance_and_view is None) and (poses is not None) and (self.__los is not None):
+                distance_and_view = self.__los.distance_and_view(poses['r1'], poses['r2'])
+            if distance_and_view is None:
+                return None
+            inputs['distance'], inputs['line_of_sight'] = distance_and_view[0], distance_and_view[1]
+        if needs_poses:
+            inputs['poses'] = poses
+        if needs_rasters:
+            inputs['rasters'] = self.__get_rasters()
+
+        result = self.__model_evaluate(inputs)
+        logger.info("RCS: '%s' & '%s' %s", self.__robot_names['r1'].upper(), self.__robot_names['r2'].upper(),\
+                LazyExplanation(self.__model_object, self.__spec, inputs, result), extra = self.__log_extra(result))
+        if self.__history is not None:
+            self.__record(inputs, poses, result)
+        return result
+
+    ## @param[in] history Time series (e.g. @ref rcs_history.LinkHistory with the default shape) where each result is appended
+    # with its distance and free space path loss, or None to stop recording.
+    # @details The distance is the one given to the model, or the distance between the Pose sensors for the models that only use the poses.
+    def set_history(self, history):
+        self.__history = history
+
+    ## @return The time series given to set_history(), or None.
+    def get_history(self):
+        return self.__history
+
+    ## @return Dictionary with the names of the 2 robots ('r1', 'r2') and the names of their Pose sensors ('r1_pose', 'r2_pose').
+    def get_robot_names(self):
+        return dict(self.__robot_names)
+
+    ## @return The Morse connection of the instance (see MorsePool), for the subclasses that read Morse in other ways (e.g. @ref rcs_async.AsyncRCS).
+    def _get_morse(self):
+        return self.__morse
 
     ## @brief This method sets a communication model and its specifications between the 2 robots.
     # @param[in] kwargs 'model'
@@ -124,7 +1610,13 @@ class RCS():
     # @param[in] kwargs 'freq' (MHz)
     # @param[in] kwargs 'free_space_threshold' (dB)
     # @param[in] kwargs 'plm' This has to be a dictionary containing the Path Loss Map parameters
-    # @details Available models: @ref __models
+    # @param[in] kwargs 'plm_sampling' 'full' loads the whole Path Loss Maps in memory; 'window' only reads the block under each robot (for very large maps);
+    # 'classes' loads the Path Loss Maps baked into Data Rate classes (4x less memory, see PLMClassRaster);
+    # 'pyramid' only reads the pixels of the regions near the thresholds (see PLMPyramidRaster)
+    # @param[in] kwargs 'los' Local line-of-sight engine (e.g. @ref rcs_los.DSMLineOfSight) that computes the distance and the line-of-sight
+    # from the Pose sensors, instead of the 'distance_and_view' service of Morse. None to use the service again.
+    # @param[in] kwargs The specifications added by the registered models (see CommunicationModel.defaults)
+    # @details Available models: see ModelRegistry
     # @details Default values are established in case the respective arguments are wrongly (or not) passed.
 	# @details Usage examples:
 	# @code r0r1.set_model_specifications(model = "free_space_loss", freq = 800, free_space_threshold = 120)
@@ -136,7 +1628,7 @@ class RCS():
     def set_model_specifications(self, **kwargs):
         
         if ("model" in kwargs) and self.model_exists(kwargs["model"]):
-            self.__model = kwargs["model"]
+            self.__model = kwargs["model"].lower()
         else:
             if self.__model is None:
                 self.__model = self.__default_model
@@ -152,8 +1644,6 @@ class RCS():
             if self.__distance_threshold is None:
                 self.__distance_threshold = self.__default_distance_threshold
             #else: Keeping the previous value
-        if self.__model is 'distance': 
-            logger.info("Distance Threshold (m): %i" %self.__distance_threshold)
         #---------------------------------------
 
         if "freq" in kwargs:
@@ -162,8 +1652,6 @@ class RCS():
             if self.__frequency is None:
                 self.__frequency = self.__default_frequency
             #else: Keeping the previous value
-        if self.__model is 'free_space_loss':
-            logger.info("Frequency (MHz): %i" %self.__frequency)
         #---------------------------------------
         
         if "free_space_threshold" in kwargs:
@@ -172,26 +1660,61 @@ class RCS():
             if self.__free_space_threshold is None:
                 self.__free_space_threshold = self.__default_free_space_threshold
             #else: Keeping the previous value
-        if self.__model is 'free_space_loss':
-            logger.info("Free Space Path Loss Threshold (dB): %s" %self.__free_space_threshold)
         #---------------------------------------
         
-        if ("plm" in kwargs) and (self.__check_plm_dictionary(kwargs["plm"])):
+        if ("plm" in kwargs) and (self.check_plm_dictionary(kwargs["plm"])):
                 self.__plm = kwargs["plm"]
         else:
             if self.__plm is None:
                 self.__plm = self.__default_plm
             #else: Keeping the previous value
-        if self.__model is 'plm':
-            logger.info("Path Loss Map parameters: %s" %self.__plm)
         #---------------------------------------
 
+        if ("plm_sampling" in kwargs) and plm_cache.sampling_exists(kwargs["plm_sampling"]):
+            self.__plm_sampling = kwargs["plm_sampling"]
+        else:
+            if self.__plm_sampling is None:
+                self.__plm_sampling = self.__default_plm_sampling
+            #else: Keeping the previous value
+        #---------------------------------------
+
+        if ("los" in kwargs) and ((kwargs["los"] is None) or hasattr(kwargs["los"], 'distance_and_view')):
+            self.__los = kwargs["los"]
+        #---------------------------------------
+
+        for name, default in models.get_defaults().items():
+            if name in kwargs:
+                self.__parameters[name] = kwargs[name]
+            elif name not in self.__parameters:
+                self.__parameters[name] = default
+            #else: Keeping the previous value
+        #---------------------------------------
+
+        # The model is resolved once, with the inputs it needs
+        model = models.get(self.__model)
+        self.__model_object = model
+        self.__spec = self.get_specifications()
+        self.__model_evaluate = model.bind(self.__spec)
+        self.__needs = (('distance' in model.inputs) or ('line_of_sight' in model.inputs), 'poses' in model.inputs, 'rasters' in model.inputs)
+        required = []
+        if self.__needs[1] or self.__needs[2]:
+            required.append('poses')
+        if self.__needs[0]:
+            if self.__los is not None:
+                logger.info("Line-of-sight engine: %s" %type(self.__los).__name__)
+                required.append('poses')
+            else:
+                required.append('distance_and_view')
+        self.__required_inputs = tuple(sorted(set(required)))
+        logger.info(model.describe(self.__spec))
+
     ## @param[in] d Dictionary with the parameters of the Path Loss Map model.
     # @return True (False) if they (do not) satisfy the mandatory conditions.
-    def __check_plm_dictionary(self, d):
+    @classmethod
+    def check_plm_dictionary(cls, d):
         
         result = False
-        if (len(d) == len(self.__default_plm)) and (d.keys() == self.__default_plm.keys()):
+        if (len(d) == len(cls.__default_plm)) and (d.keys() == cls.__default_plm.keys()):
             if (d['t3'] > d['t2'] > d['t1'] > 0):
                 if (d['dr0'] > d['dr1'] > d['dr2'] > d['dr3']):
                     result = True
@@ -201,9 +1724,27 @@ class RCS():
 
     ## @param[in] model String containing the communication model.
     # @return True (False) if the model exists (or not) in this module.
-    def model_exists(self, model):
-        if model.lower() in self.__models:  return True
-        else:                               return False
+    @classmethod
+    def model_exists(cls, model):
+        return models.exists(model)
+
+    ## @return Dictionary with the default model specifications, using the same keys of set_model_specifications().
+    # @details Used by the classes that share the models of RCS (e.g. @ref rcs_network.RCSNetwork).
+    @classmethod
+    def get_default_specifications(cls):
+        specifications = models.get_defaults()
+        specifications.update({'model': cls.__default_model, 'distance_threshold': cls.__default_distance_threshold,
+                'freq': cls.__default_frequency, 'free_space_threshold': cls.__default_free_space_threshold,
+                'plm': dict(cls.__default_plm), 'plm_sampling': cls.__default_plm_sampling, 'los': None})
+        return specifications
+
+    ## @return Dictionary with the current model specifications, using the same keys of set_model_specifications().
+    def get_specifications(self):
+        specifications = dict(self.__parameters)
+        specifications.update({'model': self.__model, 'distance_threshold': self.__distance_threshold,
+                'freq': self.__frequency, 'free_space_threshold': self.__free_space_threshold,
+                'plm': dict(self.__plm), 'plm_sampling': self.__plm_sampling, 'los': self.__los})
+        return specifications
 
     ## @param[in] spec Boolean to return or not the current model specifications.
     # @return A string with the communication model currently established between the 2 robots and its current specifications if spec is true.
@@ -211,151 +1752,55 @@ class RCS():
         if spec is False:
             return self.__model
         else:
-            if self.__model is 'distance':
-                return "Model: Distance;   Threshold: " + str(self.__distance_threshold)
-            elif self.__model is 'line_of_sight':
-                return "Model: Line of Sight"
-            elif self.__model is 'free_space_loss':
-                return "Model: Free Space Loss;   Threshold: " + str(self.__free_space_threshold) \
-                        + "(dB)   Frequency: " + str(self.__frequency) + "(MHz)"
-            elif self.__model is 'plm':
-                return "Model: Path Loss Map;   Parameters: " + str(self.__plm)
-    
-    ## @return True (False) if the distance between the 2 robots is less (greater or equal) than DISTANCE THRESHOLD.    
-    def __simulate_comm_distance(self):
-        result = self.__get_distance_and_lineofsight()
-        if result[0] < self.__distance_threshold: 
-            print("\n\n")
-            logger.info("RCS: '%s' & '%s' can communicate, because DISTANCE is: %i (<%i)"\
-                    %(self.__robot_names['r1'].upper(), self.__robot_names['r2'].upper(), result[0], self.__distance_threshold))
-            return 1            
-        else:  
-            logger.info("RCS: '%s' & '%s' CANNOT communicate, because DISTANCE is: %i (>=%i)"\
-                    %(self.__robot_names['r1'].upper(), self.__robot_names['r2'].upper(), result[0], self.__distance_threshold))
-            return 0
-
-    ## @return True (False) if the 2 robots are (not) in line-of-sight.
-    def __simulate_comm_lineofsight(self):
-        result = self.__get_distance_and_lineofsight()
-        if result[1]:
-            logger.info("RCS: '%s' & '%s' can communicate, because LINE-of-SIGHT is: %s"\
-                    %(self.__robot_names['r1'].upper(), self.__robot_names['r2'].upper(), result[1]))
-            return 1
-        else:            
-            logger.info("RCS: '%s' & '%s' CANNOT communicate, because LINE-of-SIGHT is: %s"\
-                    %(self.__robot_names['r1'].upper(), self.__robot_names['r2'].upper(), result[1]))
-            return 0
-
-    ## @return True (False) if the path loss is less (greater or equal) than FREE SPACE THRESHOLD.
-    # @details Formula obtained from @cite paper_2002. 
-    # @todo When the robot antennas will be defined on Morse, then get the gain Gt and Gr
-    def __simulate_comm_freespaceloss(self):
-        Gt = 2; Gr = 2; c = 299792458;
-        result = self.__get_distance_and_lineofsight()
-        wavelength = float(c/(self.__frequency*math.pow(10, 6)))
-        loss = float(-10*math.log10((Gt*Gr*math.pow(wavelength, 2))/math.pow(4*math.pi*result[0], 2)))
-        if loss < self.__free_space_threshold: 
-            logger.info("RCS: '%s' & '%s' can communicate, because FREE SPACE LOSS is: %i (<%i)"\
-                    %(self.__robot_names['r1'].upper(), self.__robot_names['r2'].upper(), loss, self.__free_space_threshold))
-            return 1
-        else:  
-            logger.info("RCS: '%s' & '%s' CANNOT communicate, because FREE SPACE LOSS is: %i (>=%i)"\
-                    %(self.__robot_names['r1'].upper(), self.__robot_names['r2'].upper(), loss, self.__free_space_threshold))
-            return 0
+            return self.__model_object.describe(self.__spec)
 
     ## @return A list with 2 arguments: distance between the 2 robots, line-of-sight (boolean). 
+    # @see MorseSnapshot
     def __get_distance_and_lineofsight(self):
         try:
-                return self.__morse.rpc('communication', 'distance_and_view', self.__robot_names['r1'], self.__robot_names['r2'])
+                return snapshot.get_distance_and_view(self.__morse, self.__robot_names['r1'], self.__robot_names['r2'])
         except  pymorse.MorseServerError as mse:
-            logger.error('Oups! An error occurred!', mse)
+            logger.error('Oups! An error occurred! %s', mse)
+
+    ## @return Dictionary {'r1': pose, 'r2': pose} with the data of the Pose sensors of the 2 robots.
+    # @see MorseSnapshot
+    def __get_poses(self):
+        poses = {}
+        for key in ('r1', 'r2'):
+            poses[key] = snapshot.get_pose(self.__morse, self.__robot_names[key], self.__robot_names[key+'_pose'])
+        return poses
 
-    ## @return The Data Rate (Mb/s) of the respective path loss condition according to the current (robot) position.
+    ## @return Dictionary {'r1': raster, 'r2': raster} with the Path Loss Map rasters of the 2 robots (input 'rasters').
+    # @details The rasters are taken from @ref plm_cache, so each file is only read again when it changes on disk.
+    # @exception Exit if a Path Loss Map file could not be opened.
     # @note The Path Loss Map files must be in the same directory of rcs.py and the file name must have this format: 'plm_'+robotname+'.tif'.
-    def __simulate_comm_pathlossmap(self):
-        
-        filenames = {'r1': 'plm_'+self.__robot_names['r1']+'.tif', 'r2': 'plm_'+self.__robot_names['r2']+'.tif'}
-        pathlosses = {'r1': None, 'r2': None}
-        for key in filenames:
-            dataset = gdal.Open(filenames[key], GA_ReadOnly)
-            if dataset is None:
-                logger.error('\n\nPath Loss Map File "%s" could not be opened.\nBye...\n\n' %filenames[key])
+    def __get_rasters(self):
+        rasters = {}
+        for key in ('r1', 'r2'):
+            filename = 'plm_'+self.__robot_names[key]+'.tif'
+            rasters[key] = plm_cache.get(filename, self.__plm_sampling, (self.__plm['t1'], self.__plm['t2'], self.__plm['t3']))
+            if rasters[key] is None:
+                logger.error('\n\nPath Loss Map File "%s" could not be opened.\nBye...\n\n' %filename)
                 sys.exit(1)
-            else:
-                gdalinfo = {}
-                gdalinfo['X_custom_origin'] = float(dataset.GetMetadata()['CUSTOM_X_ORIGIN'])
-                gdalinfo['Y_custom_origin'] = float(dataset.GetMetadata()['CUSTOM_Y_ORIGIN'])
-                geotransform = dataset.GetGeoTransform()
-                gdalinfo['X_utm_origin'] = geotransform[0]
-                gdalinfo['Y_utm_origin'] = geotransform[3]
-                gdalinfo['X_scale'] = geotransform[1]
-                gdalinfo['Y_scale'] = geotransform[5]
-                ncols = dataset.RasterXSize
-                nrows = dataset.RasterYSize
-                band = dataset.GetRasterBand(1) # For this case, each pixel will have only a float32 value
-                map_data = band.ReadAsArray(0, 0, ncols, nrows);    
-                # debug: print('\n\nData from "%s":\n%s'%(filenames[key], map_data));
-                
-                temp1 = getattr(self.__morse, self.__robot_names[key])
-                if key == 'r1':
-                    temp2 = getattr(temp1, self.__robot_names['r1_pose'])
-                else:
-                    temp2 = getattr(temp1, self.__robot_names['r2_pose'])
-                morse_pose_coordinates = {}; pixel = {} 
-                morse_pose_coordinates['x'] = temp2.get()['x']
-                morse_pose_coordinates['y'] = temp2.get()['y'];     #morse_pose_coordinates['z'] = temp2.get()['z']
-                pixel = self.__getPixel_coordinates(gdalinfo, morse_pose_coordinates)
-                # Important Numpy note to read an array element: array[row][col]
-                pathlosses[key] = map_data[pixel['y']][pixel['x']]
-                # debug: print('Gdalinfo: ' + str(gdalinfo), '\n\nMorse Pose Coordinates: ', str(morse_pose_coordinates))
-                # debug: print('Pixel coordinates: ', pixel)
-                # debug: print('Pathloss of %s: %f' %(key, pathlosses[key]))
-
-                # Closing variables
-                dataset = None; band = None; map_data = None;
-                X_custom = Y_custom = ncols = nrows = None; 
-                gdalinfo = None; morse_pose_coordinates = None
-        
-        # debug: print('Path Losses: ', pathlosses)
-        return self.__get_Data_Rate(max(pathlosses.values()))
+        return rasters
 
-    ## @param[in] pl Maximum Path Loss value of the 2 robots.
-    # @return The Data Rate (Mb/s) according to the respective path loss condition.
-    def __get_Data_Rate(self, pl):
-        
-        if (pl >= 0) and (pl < self.__plm['t1']):
-            result = self.__plm['dr0']
-        elif (pl >= self.__plm['t1']) and (pl < self.__plm['t2']):
-            result = self.__plm['dr1']
-        elif (pl >= self.__plm['t2']) and (pl < self.__plm['t3']):
-            result = self.__plm['dr2']
-        elif pl >= self.__plm['t3']:
-            result = self.__plm['dr3']
+    ## @param[in] inputs Dictionary with the inputs given to the model.
+    # @param[in] poses Dictionary {'r1': pose, 'r2': pose} with the data of the Pose sensors, or None.
+    # @param[in] result Result of the model.
+    def __record(self, inputs, poses, result):
+        distance = inputs.get('distance')
+        if (distance is None) and (poses is not None):
+            distance = math.sqrt(sum((poses['r1'][c] - poses['r2'][c])**2 for c in ('x', 'y', 'z')))
+        if distance is None:
+            distance = loss = float('nan')
         else:
-            logger.error("\n\nRCS: The maximum path loss between the robots "\
-                    + str(self.__robot_names['r1'].upper()) + ' & ' + str(self.__robot_names['r2'].upper())\
-                    + ' is ' + str(pl) + ".\nThere is no data rate condition to deal with this case (< 0).\n\n")
-            result = 0
-            
-        logger.info("RCS: '%s' & '%s' have a Data Rate communication of %.2f (Mb/s), because the maximum Path Loss is: %.2f"\
-                %(self.__robot_names['r1'].upper(), self.__robot_names['r2'].upper(), result, pl))
-        return result
-
-    ## @param[in] gdal Dictionary containing data coming from Geotiff file.
-    # @param[in] morse_pose Dictionary with the coordinates x,y given by morse.
-    # @return Dictionary with the pixel coordinates (x,y) to read the path loss in 'map_data'.
-    def __getPixel_coordinates(self, gdal, morse_pose):
-
-        # Convert Morse Pose coordinates to Morse Pose UTM coordinates
-        x = float(morse_pose['x'] + gdal['X_custom_origin'])
-        y = float(morse_pose['y'] + gdal['Y_custom_origin'])
-
-        # Convert UTM to Pixel
-        p = {}
-        p['x'] = int((x - gdal['X_utm_origin']) / gdal['X_scale'])
-        p['y'] = int((y - gdal['Y_utm_origin']) / gdal['Y_scale'])
-        return p
+            loss = batch_free_space_loss(distance, self.__frequency)
+        self.__history.append(distance, loss, result)
 
+    ## @param[in] result Result of the query (the value returned by can_communicate()).
+    # @return Dictionary with the pair of robots and the result of the query, given to the log records (see PairLogFilter).
+    def __log_extra(self, result):
+        return {'pair': (self.__robot_names['r1'], self.__robot_names['r2'], self.__model), 'result': result}
 
     ## @param[in] r1 Name of one robot given in the __init().
     # @param[in] r2 Name of the other robot given in the __init().
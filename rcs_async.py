@@ -0,0 +1,74 @@
+import asyncio
+import rcs
+
+
+## @brief Asyncio variant of @ref rcs.RCS.
+# @details The data needed by the communication model (the 'distance_and_view' service or the Pose sensors) is read
+# without blocking the event loop, so many pairs of robots can be polled concurrently: one tick takes about one round trip
+# to the simulator instead of one per pair. The models themselves are the same of rcs.RCS (see rcs.RCS.evaluate()).
+# @details Usage examples:
+# @code r1r2 = rcs_async.AsyncRCS('robo1', 'robo2', model = "distance", distance_threshold = 15)
+# result = await r1r2.can_communicate_async()
+# ...
+# results = await rcs_async.can_communicate_all([r1r2, r1r3, r2r3]) @endcode
+# @note The blocking can_communicate() of rcs.RCS is still available.
+class AsyncRCS(rcs.RCS):
+
+    ## @param[in] robot_1 Name of one robot.
+    # @param[in] robot_2 Name of the other robot.
+    # @param[in] kwargs See the method @ref rcs.RCS.set_model_specifications() for more information.
+    def __init__(self, robot_1, robot_2, **kwargs):
+        rcs.RCS.__init__(self, robot_1, robot_2, **kwargs)
+        ## @brief Morse connection (the one of rcs.RCS, see rcs.MorsePool)
+        self.__morse = self._get_morse()
+
+    ## @return 1 (0) if the 2 robots can (cannot) communicate according to the established communication model,
+    # or None if the 'distance_and_view' service failed (the error is logged, see rcs.RCS.evaluate()).
+    # @exception For the Path Loss Map model, it returns the Data Rate (Mb/s).
+    async def can_communicate_async(self):
+        names = self.get_robot_names()
+        required = self.get_required_inputs()
+        requests = []
+        if 'poses' in required:
+            requests += [self.__get_pose(names['r1'], names['r1_pose']), self.__get_pose(names['r2'], names['r2_pose'])]
+        if 'distance_and_view' in required:
+            requests.append(self.__get_distance_and_view(names['r1'], names['r2']))
+        results = await asyncio.gather(*requests)
+
+        poses = {'r1': results[0], 'r2': results[1]} if 'poses' in required else None
+        distance_and_view = results[-1] if 'distance_and_view' in required else None
+        return self.evaluate(distance_and_view = distance_and_view, poses = poses)
+
+    ## @param[in] robot_1 Name of one robot.
+    # @param[in] robot_2 Name of the other robot.
+    # @return The result of the 'distance_and_view' service (see rcs.MorseSnapshot), or None if the service failed (like rcs.RCS).
+    async def __get_distance_and_view(self, robot_1, robot_2):
+        key = rcs.snapshot.distance_and_view_key(self.__morse, robot_1, robot_2)
+        result = rcs.snapshot.lookup(key)
+        if result is None:
+            try:
+                result = await asyncio.wrap_future(self.__morse.rpc_future('communication', 'distance_and_view', robot_1, robot_2))
+            except rcs.pymorse.MorseServerError as mse:
+                rcs.logger.error('Oups! An error occurred! %s', mse)
+                return None
+            rcs.snapshot.store(key, result)
+        return result
+
+    ## @param[in] robot Name of the robot.
+    # @param[in] pose Name of its Pose sensor.
+    # @return The data of the Pose sensor (see rcs.MorseSnapshot).
+    async def __get_pose(self, robot, pose):
+        key = rcs.snapshot.pose_key(self.__morse, robot, pose)
+        result = rcs.snapshot.lookup(key)
+        if result is None:
+            component = self.__morse.get_component(robot, pose)
+            result = await asyncio.wrap_future(self.__morse.submit(component.get))
+            rcs.snapshot.store(key, result)
+        return result
+
+
+## @param[in] instances List of AsyncRCS instances (e.g. one per pair of robots).
+# @return List with the results of can_communicate_async() of every instance, in the same order.
+# @details All the instances are polled concurrently. A pair whose 'distance_and_view' service failed gets None, the others are not affected.
+async def can_communicate_all(instances):
+    return await asyncio.gather(*[instance.can_communicate_async() for instance in instances])
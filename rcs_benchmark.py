@@ -0,0 +1,301 @@
+#! /usr/bin/env python3
+import sys, os, time, math, random, types, tempfile, tracemalloc, argparse, subprocess
+import gdal, numpy
+
+""" Benchmark of the hot paths of rcs.py, without the Morse simulator.
+
+The Morse client (pymorse.Morse) is replaced by FakeMorse, which emulates the services 'list_robots', 'list_streams',
+'distance_and_view' and the Pose sensor streams of a scene of random walking robots, with a configurable latency.
+The Path Loss Maps are synthetic GeoTIFFs, filled like create_PLM.py (path loss increasing 0.75 dB per column).
+
+Usage examples:
+python3 rcs_benchmark.py
+python3 rcs_benchmark.py --latency 0.5 --robots 2 4 8 16 --plm-size 4000
+"""
+
+
+# -----------------------------MORSE STAND-IN ------------------------------------------
+
+## @brief Scene of robots walking randomly inside a rectangle (Morse coordinates), used by FakeMorse.
+class FakeScene():
+
+    ## @param[in] robots Number of robots ('robo1', 'robo2', ...).
+    # @param[in] width Units: meters. Size x of the area.
+    # @param[in] height Units: meters. Size y of the area.
+    # @param[in] los_range Units: meters. The robots are in line-of-sight below this distance.
+    # @param[in] seed Seed of the random walk.
+    def __init__(self, robots, width, height, los_range = 100, seed = 0):
+        self.width = width
+        self.height = height
+        self.los_range = los_range
+        self.__random = random.Random(seed)
+        ## @brief Dictionary with the pose (x,y,z) of each robot
+        self.poses = {}
+        for k in range(robots):
+            self.poses['robo%i' %(k+1)] = {'x': self.__random.uniform(1, width-1), 'y': self.__random.uniform(1, height-1), 'z': 0.0}
+
+    ## @param[in] step Units: meters. Maximum movement of each robot.
+    def move(self, step = 1.0):
+        for pose in self.poses.values():
+            pose['x'] = min(max(pose['x'] + self.__random.uniform(-step, step), 1), self.width-1)
+            pose['y'] = min(max(pose['y'] + self.__random.uniform(-step, step), 1), self.height-1)
+
+    ## @param[in] r1 Name of one robot.
+    # @param[in] r2 Name of the other robot.
+    # @return A list with 2 arguments: distance between the 2 robots, line-of-sight (boolean).
+    def distance_and_view(self, r1, r2):
+        p1 = self.poses[r1]; p2 = self.poses[r2]
+        distance = math.sqrt((p1['x']-p2['x'])**2 + (p1['y']-p2['y'])**2 + (p1['z']-p2['z'])**2)
+        return [distance, distance < self.los_range]
+
+
+## @brief Data stream of a Pose sensor of FakeMorse.
+class FakePoseStream():
+
+    def __init__(self, robot):
+        self.__robot = robot
+
+    ## @return The pose of the robot, after the latency of the connection (like waiting for the next message).
+    def get(self, timeout = None):
+        if FakeMorse.latency:
+            time.sleep(FakeMorse.latency)
+        return dict(FakeMorse.scene.poses[self.__robot], yaw = 0.0, pitch = 0.0, roll = 0.0)
+
+    ## @return The pose of the robot, without waiting.
+    def last(self):
+        return dict(FakeMorse.scene.poses[self.__robot], yaw = 0.0, pitch = 0.0, roll = 0.0)
+
+
+## @brief Stand-in of pymorse.Morse, with the services and streams used by rcs.py.
+# @details The scene and the latency (seconds) of each request are class attributes, so they can be changed between benchmarks.
+class FakeMorse():
+
+    scene = None
+    latency = 0.0
+
+    def __init__(self, host = "localhost", port = 4000):
+        self.__requests = {}
+        self.__next_id = 0
+
+    ## @return A component whose Pose sensor is 'pose' (see 'list_streams'), for robot names.
+    def __getattr__(self, name):
+        if name in FakeMorse.scene.poses:
+            return types.SimpleNamespace(pose = FakePoseStream(name))
+        raise AttributeError(name)
+
+    def _rpc_request(self, component, service, *args):
+        self.__next_id += 1
+        self.__requests[self.__next_id] = (component, service, args)
+        return self.__next_id
+
+    def _rpc_process(self, request, timeout = None):
+        component, service, args = self.__requests.pop(request)
+        if FakeMorse.latency:
+            time.sleep(FakeMorse.latency)
+        if service == 'list_robots':
+            return list(FakeMorse.scene.poses)
+        elif service == 'list_streams':
+            return [robot + '.pose' for robot in FakeMorse.scene.poses]
+        elif service == 'distance_and_view':
+            return FakeMorse.scene.distance_and_view(*args)
+        raise FakeMorseServerError('Service "%s.%s" is not emulated' %(component, service))
+
+    def rpc(self, component, service, *args):
+        return self._rpc_process(self._rpc_request(component, service, *args))
+
+    def close(self):
+        pass
+
+
+class FakeMorseServerError(Exception):
+    pass
+
+
+## @brief Replaces pymorse.Morse by FakeMorse. If pymorse is not installed, a module with FakeMorse is used instead.
+# @details It must be called before importing rcs.
+def install_fake_morse():
+    try:
+        import pymorse
+    except ImportError:
+        pymorse = types.ModuleType('pymorse')
+        pymorse.MorseServerError = FakeMorseServerError
+        sys.modules['pymorse'] = pymorse
+    pymorse.Morse = FakeMorse
+# --------------------------------------------------------------------------------------
+
+
+# -----------------------------SYNTHETIC PATH LOSS MAPS --------------------------------
+
+## @param[in] filename Name of the GeoTIFF file.
+# @param[in] ncols Number of columns.
+# @param[in] nrows Number of rows.
+# @param[in] scale Units: meters. Size of each pixel.
+# @param[in] step Units: dB. Increase of the path loss per column (like create_PLM.py).
+# @details The custom origin maps the Morse coordinates (0, 0) to the lower left corner of the map.
+def create_synthetic_plm(filename, ncols, nrows, scale = 0.5, step = 0.75):
+    x_utm_origin = 491000.0; y_utm_origin = 4463000.0
+    dataset = gdal.GetDriverByName('GTiff').Create(filename, ncols, nrows, 1, gdal.GDT_Float32)
+    dataset.SetGeoTransform((x_utm_origin, scale, 0, y_utm_origin, 0, -scale))
+    dataset.SetMetadata({'CUSTOM_X_ORIGIN': str(x_utm_origin), 'CUSTOM_Y_ORIGIN': str(y_utm_origin - nrows*scale), 'CUSTOM_Z_ORIGIN': '0'})
+    row = numpy.arange(0, step*ncols, step, 'float32')[:ncols]
+    dataset.GetRasterBand(1).WriteArray(numpy.array([row,]*nrows), 0, 0)
+    dataset.FlushCache()
+    dataset = None
+# --------------------------------------------------------------------------------------
+
+
+# -----------------------------BENCHMARKS ----------------------------------------------
+
+## @param[in] samples List with the durations (seconds).
+# @return String with the percentiles 50, 90, 99 and the maximum (microseconds).
+def format_latencies(samples):
+    p = numpy.percentile(numpy.array(samples) * 1e6, [50, 90, 99, 100])
+    return "p50 %9.1f   p90 %9.1f   p99 %9.1f   max %9.1f  (us)" %tuple(p)
+
+## @brief Time of 'import rcs' in a new interpreter, and the heavy dependencies it imported (there should be none, see rcs.py).
+# @param[in] target Units: milliseconds. Import time target.
+# @param[in] runs Number of interpreters started (the best time is reported).
+def benchmark_import(target = 20.0, runs = 5):
+    code = "import sys, time; start = time.perf_counter(); import rcs; print(time.perf_counter() - start); "\
+           "print(','.join(m for m in ('numpy', 'gdal', 'pymorse') if m in sys.modules))"
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for k in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', code], cwd = directory).decode().split('\n')
+        times.append(float(output[0]) * 1e3)
+    print("\nimport rcs: %.1f ms (target: < %.0f ms), heavy modules imported: %s" %(min(times), target, output[1] or 'none'))
+
+## @brief Latency of RCS.can_communicate() for each model (the robots move between calls).
+def benchmark_models(rcs, scene, plm, calls):
+    print("\nRCS.can_communicate() latency (%i calls)" %calls)
+    specifications = [('distance', {'model': 'distance', 'distance_threshold': 15}),
+                      ('line_of_sight', {'model': 'line_of_sight'}),
+                      ('free_space_loss', {'model': 'free_space_loss', 'freq': 750, 'free_space_threshold': 55})]
+    for sampling in ('full', 'window', 'classes', 'pyramid'):
+        specifications.append(('plm (%s)' %sampling, {'model': 'plm', 'plm': plm, 'plm_sampling': sampling}))
+    for name, kwargs in specifications:
+        link = rcs.RCS('robo1', 'robo2', **kwargs)
+        link.can_communicate()      # the rasters are loaded before timing
+        samples = []
+        for k in range(calls):
+            scene.move()
+            start = time.perf_counter()
+            link.can_communicate()
+            samples.append(time.perf_counter() - start)
+        print("  %-18s %s" %(name, format_latencies(samples)))
+        del link
+
+## @brief Throughput (pairs per second) of one RCS instance per pair and of rcs_network.RCSNetwork, versus the number of robots.
+def benchmark_network(rcs, rcs_network, plm, robots, area, ticks):
+    print("\nThroughput versus number of robots (%i ticks, pairs/s)" %ticks)
+    print("  %6s %6s   %-16s %14s %14s" %('robots', 'pairs', 'model', 'RCS per pair', 'RCSNetwork'))
+    for n in robots:
+        FakeMorse.scene = scene = FakeScene(n, *area)
+        pairs = n*(n-1)//2
+        for model, kwargs in (('distance', {'distance_threshold': 15}), ('plm', {'plm': plm})):
+            links = [rcs.RCS('robo%i' %(i+1), 'robo%i' %(j+1), model = model, **kwargs) for i in range(n) for j in range(i+1, n)]
+            network = rcs_network.RCSNetwork(model = model, **kwargs)
+            results = []
+            for evaluate in (lambda: [link.can_communicate() for link in links], network.can_communicate):
+                evaluate()
+                start = time.perf_counter()
+                for k in range(ticks):
+                    scene.move()
+                    rcs.snapshot.tick()
+                    evaluate()
+                results.append(pairs * ticks / (time.perf_counter() - start))
+            print("  %6i %6i   %-16s %14.0f %14.0f" %(n, pairs, model, results[0], results[1]))
+            del links, network
+
+## @brief Time and memory used to load a Path Loss Map with each sampling mode.
+def benchmark_plm_memory(rcs, filename, plm, queries):
+    print("\nPath Loss Map loading ('%s', %i queries)" %(os.path.basename(filename), queries))
+    print("  %-8s %10s %14s %14s %16s" %('sampling', 'load (ms)', 'raster (MB)', 'peak (MB)', 'queries/s'))
+    gdalinfo = None
+    for sampling in ('full', 'window', 'classes', 'pyramid'):
+        rcs.plm_cache.clear()
+        thresholds = (plm['t1'], plm['t2'], plm['t3']) if rcs.plm_cache.gives_classes(sampling) else None
+        tracemalloc.start()
+        start = time.perf_counter()
+        raster = rcs.plm_cache.get(filename, sampling, thresholds)
+        load = time.perf_counter() - start
+        if gdalinfo is None:
+            gdalinfo = raster.gdalinfo
+        random_state = numpy.random.RandomState(0)
+        positions = numpy.column_stack((random_state.uniform(1, raster.ncols*gdalinfo['X_scale']-1, queries),
+                                        random_state.uniform(1, -raster.nrows*gdalinfo['Y_scale']-1, queries)))
+        cols, rows = rcs.batch_pixel_coordinates(gdalinfo, positions)
+        pixels = [{'x': x, 'y': y} for x, y in zip(cols.tolist(), rows.tolist())]
+        start = time.perf_counter()
+        for pixel in pixels:
+            if rcs.plm_cache.gives_classes(sampling):
+                raster.get_class(pixel)
+            else:
+                raster.get_pathloss(pixel)
+        rate = queries / (time.perf_counter() - start)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("  %-8s %10.1f %14.2f %14.2f %16.0f" %(sampling, load*1e3, raster.nbytes/2.0**20, peak/2.0**20, rate))
+        raster = None
+    rcs.plm_cache.clear()
+
+## @brief Throughput of the batch functions (positions per second).
+def benchmark_batch(rcs, plm, area, size):
+    print("\nBatch evaluation (%i positions, positions/s)" %size)
+    random_state = numpy.random.RandomState(0)
+    p1 = numpy.column_stack((random_state.uniform(1, area[0]-1, size), random_state.uniform(1, area[1]-1, size), numpy.zeros(size)))
+    p2 = numpy.column_stack((random_state.uniform(1, area[0]-1, size), random_state.uniform(1, area[1]-1, size), numpy.zeros(size)))
+    tests = [('batch_distance_model', lambda: rcs.batch_distance_model(rcs.batch_distance(p1, p2), 15)),
+             ('batch_free_space_loss_model', lambda: rcs.batch_free_space_loss_model(rcs.batch_distance(p1, p2), 750, 55))]
+    for sampling in ('full', 'window', 'classes', 'pyramid'):
+        tests.append(('batch_plm_model (%s)' %sampling, lambda sampling = sampling: rcs.batch_plm_model(p1, p2, 'plm_robo1.tif', 'plm_robo2.tif', plm, sampling)))
+    for name, function in tests:
+        function()
+        start = time.perf_counter()
+        function()
+        print("  %-28s %14.0f" %(name, size / (time.perf_counter() - start)))
+# --------------------------------------------------------------------------------------
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark of rcs.py with a Morse stand-in and synthetic Path Loss Maps.')
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'latency of each Morse request (ms)')
+    parser.add_argument('--calls', type = int, default = 2000, help = 'calls per model in the latency benchmark')
+    parser.add_argument('--robots', type = int, nargs = '+', default = [2, 4, 8, 16, 32], help = 'numbers of robots in the throughput benchmark')
+    parser.add_argument('--ticks', type = int, default = 20, help = 'ticks per number of robots in the throughput benchmark')
+    parser.add_argument('--plm-size', type = int, default = 2000, help = 'columns and rows of the Path Loss Maps')
+    parser.add_argument('--queries', type = int, default = 20000, help = 'queries in the Path Loss Map benchmark')
+    parser.add_argument('--batch', type = int, default = 1000000, help = 'positions in the batch benchmark')
+    args = parser.parse_args()
+
+    benchmark_import()
+    install_fake_morse()
+    import rcs, rcs_network
+
+    # The synthetic Path Loss Maps (tens of MB) are removed at the end, even if a benchmark fails
+    with tempfile.TemporaryDirectory(prefix = 'rcs_benchmark_') as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)   # the Path Loss Maps are read from the current directory
+        try:
+            print("Synthetic Path Loss Maps (%i x %i) in %s" %(args.plm_size, args.plm_size, directory))
+            create_synthetic_plm(os.path.abspath('plm_robo1.tif'), args.plm_size, args.plm_size)
+            for k in range(2, max(args.robots + [2]) + 1):
+                # Hard links: each robot has its own file (and raster), without writing it again
+                os.link('plm_robo1.tif', 'plm_robo%i.tif' %k)
+
+            area = (args.plm_size * 0.5, args.plm_size * 0.5)
+            step = 0.75 * args.plm_size / 4
+            plm = {'t1': step, 't2': 2*step, 't3': 3*step, 'dr0': 4, 'dr1': 3, 'dr2': 2, 'dr3': 1}
+            FakeMorse.scene = scene = FakeScene(2, *area)
+            FakeMorse.latency = args.latency / 1000.0
+            print("Morse stand-in latency: %.3f ms" %args.latency)
+
+            benchmark_models(rcs, scene, plm, args.calls)
+            benchmark_network(rcs, rcs_network, plm, args.robots, area, args.ticks)
+            benchmark_plm_memory(rcs, os.path.abspath('plm_robo1.tif'), plm, args.queries)
+            benchmark_batch(rcs, plm, area, args.batch)
+        finally:
+            os.chdir(cwd)
+
+if __name__ == "__main__":
+    main()
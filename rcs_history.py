@@ -0,0 +1,159 @@
+import time
+import numpy
+
+
+## @brief This class keeps a bounded time series of the quality of one link, or of several links at once (see RCS.set_history()
+# and rcs_network.RCSNetwork.set_history()), with smoothed values that are updated on each sample.
+# @details Each sample has a timestamp and these columns: 'distance' (meters), 'loss' (free space path loss in dB at the
+# frequency of the model) and 'data_rate' (the result of can_communicate(): 0/1, or the Data Rate in Mb/s for the 'plm' model).
+# The samples are kept in preallocated Numpy arrays with room for the last 'capacity' samples, so the memory does not grow
+# with the length of the mission.
+# @details On each append(), in constant time:
+# - the exponentially weighted moving average (EWMA) of each column is updated (samples with NaN are skipped),
+# - the minimum and maximum of the last 'window' samples are updated, with blocks of 'window' samples: the running
+# minimum/maximum of the current block and the suffix minima/maxima of the previous block (computed once per block),
+# - if the thresholds 'up' and 'down' are given, the state of the link only goes up when the EWMA of the Data Rate
+# reaches 'up', and only goes down when it falls below 'down', so the link does not flap around a threshold.
+# @details Usage examples:
+# @code history = rcs_history.LinkHistory(capacity = 4096, alpha = 0.2, window = 20, up = 0.7, down = 0.3)
+# r1r2 = rcs.RCS('robo1', 'robo2', model = 'distance', distance_threshold = 15)
+# r1r2.set_history(history)
+# while running:
+#     r1r2.can_communicate()
+#     if history.get_link(): ...
+# history.get_ewma('distance'), history.get_min('data_rate')
+# times, rates = history.get_series('data_rate') @endcode
+class LinkHistory():
+
+    ## @brief Columns of each sample.
+    COLUMNS = ('distance', 'loss', 'data_rate')
+
+    ## @param[in] capacity Number of samples kept (the oldest ones are replaced).
+    # @param[in] shape Shape of the links of each sample: () for one link (see RCS), (P,) for the P pairs of a network.
+    # @param[in] alpha Weight of each new sample in the EWMA (0 < alpha <= 1).
+    # @param[in] window Number of samples of the windowed minimum and maximum.
+    # @param[in] up Units: the ones of 'data_rate'. EWMA at which a link goes up (None: no hysteresis).
+    # @param[in] down Units: the ones of 'data_rate'. EWMA below which a link goes down (down <= up).
+    # @exception ValueError if the parameters are not valid.
+    def __init__(self, capacity = 1024, shape = (), alpha = 0.1, window = 16, up = None, down = None):
+        if (capacity < 1) or (window < 1) or not (0 < alpha <= 1) or ((up is None) != (down is None)) or ((up is not None) and (down > up)):
+            raise ValueError('Wrong Link History parameters: capacity %s, alpha %s, window %s, up %s, down %s'\
+                    %(capacity, alpha, window, up, down))
+        ## @brief Number of samples kept
+        self.capacity = capacity
+        ## @brief Shape of the links of each sample
+        self.shape = tuple(shape)
+        self.alpha = alpha
+        self.window = window
+        self.up = up
+        self.down = down
+        self.clear()
+
+    ## @brief Removes all the samples.
+    def clear(self):
+        columns = self.shape + (len(self.COLUMNS),)
+        ## @brief Ring buffers: timestamps and samples (capacity x shape x columns)
+        self.__times = numpy.zeros(self.capacity)
+        self.__samples = numpy.zeros((self.capacity,) + columns)
+        ## @brief Number of samples appended since the creation (or clear())
+        self.__count = 0
+        ## @brief EWMA of each column
+        self.__ewma = numpy.full(columns, numpy.nan)
+        ## @brief Samples of the current block of the window, their running minimum/maximum, and the suffix minima/maxima of the previous block
+        self.__block = numpy.full((self.window,) + columns, numpy.nan)
+        self.__prefix_min = numpy.full(columns, numpy.nan)
+        self.__prefix_max = numpy.full(columns, numpy.nan)
+        self.__suffix_min = numpy.full((self.window,) + columns, numpy.nan)
+        self.__suffix_max = numpy.full((self.window,) + columns, numpy.nan)
+        ## @brief State of the links with hysteresis (see get_link())
+        self.__link = None
+
+    ## @return The number of samples kept (at most the capacity).
+    def __len__(self):
+        return min(self.__count, self.capacity)
+
+    ## @param[in] distance Units: meters. Distance of the link(s) (NaN if unknown).
+    # @param[in] loss Units: dB. Free space path loss of the link(s) (NaN if unknown).
+    # @param[in] data_rate Result of the link(s): 0/1, or the Data Rate (Mb/s).
+    # @param[in] timestamp Seconds since the epoch (default: now).
+    def append(self, distance, loss, data_rate, timestamp = None):
+        sample = numpy.empty(self.__ewma.shape)
+        sample[..., 0] = distance
+        sample[..., 1] = loss
+        sample[..., 2] = data_rate
+        k = self.__count % self.capacity
+        self.__times[k] = time.time() if timestamp is None else timestamp
+        self.__samples[k] = sample
+
+        # EWMA (the first sample of each link starts it)
+        ewma = self.__ewma
+        updated = ewma + self.alpha * (sample - ewma)
+        self.__ewma = numpy.where(numpy.isnan(sample), ewma, numpy.where(numpy.isnan(ewma), sample, updated))
+
+        # Windowed minimum and maximum
+        offset = self.__count % self.window
+        if offset == 0:
+            if self.__count > 0:
+                self.__suffix_min = numpy.fmin.accumulate(self.__block[::-1], axis = 0)[::-1]
+                self.__suffix_max = numpy.fmax.accumulate(self.__block[::-1], axis = 0)[::-1]
+            self.__prefix_min = sample
+            self.__prefix_max = sample
+        else:
+            self.__prefix_min = numpy.fmin(self.__prefix_min, sample)
+            self.__prefix_max = numpy.fmax(self.__prefix_max, sample)
+        self.__block[offset] = sample
+        self.__count += 1
+
+        # Hysteresis on the smoothed Data Rate
+        if self.up is not None:
+            rate = self.__ewma[..., 2]
+            if self.__link is None:
+                self.__link = rate >= self.up
+            else:
+                self.__link = numpy.where(self.__link, ~(rate < self.down), rate >= self.up)
+
+    ## @param[in] name Name of the column (see COLUMNS).
+    # @return The last value of the column (a Numpy array with the shape of the links), or None if there are no samples.
+    def get_last(self, name):
+        if self.__count == 0:
+            return None
+        return self.__samples[(self.__count - 1) % self.capacity][..., self.COLUMNS.index(name)][()]
+
+    ## @param[in] name Name of the column (see COLUMNS).
+    # @return The EWMA of the column (NaN while there are no samples).
+    def get_ewma(self, name):
+        return self.__ewma[..., self.COLUMNS.index(name)][()]
+
+    ## @param[in] name Name of the column (see COLUMNS).
+    # @return The minimum of the column in the last 'window' samples (NaN while there are no samples).
+    def get_min(self, name):
+        return self.__get_window(name, self.__prefix_min, self.__suffix_min, numpy.fmin)
+
+    ## @param[in] name Name of the column (see COLUMNS).
+    # @return The maximum of the column in the last 'window' samples (NaN while there are no samples).
+    def get_max(self, name):
+        return self.__get_window(name, self.__prefix_max, self.__suffix_max, numpy.fmax)
+
+    ## @return The state of the link(s) with hysteresis: True (False) if up (down), or None if there are no samples or no thresholds.
+    def get_link(self):
+        return None if self.__link is None else self.__link[()]
+
+    ## @param[in] name Name of the column (see COLUMNS).
+    # @return Tuple with 2 Numpy arrays: the timestamps and the values of the column of the samples kept, from the oldest to the newest.
+    def get_series(self, name):
+        n = len(self)
+        order = numpy.arange(self.__count - n, self.__count) % self.capacity
+        return self.__times[order], self.__samples[order][..., self.COLUMNS.index(name)]
+
+    ## @param[in] name Name of the column.
+    # @param[in] prefix Running minimum (or maximum) of the current block.
+    # @param[in] suffix Suffix minima (or maxima) of the previous block.
+    # @param[in] function numpy.fmin or numpy.fmax.
+    # @return The minimum (or maximum) of the column in the last 'window' samples.
+    def __get_window(self, name, prefix, suffix, function):
+        column = self.COLUMNS.index(name)
+        current = (self.__count - 1) % self.window + 1
+        if (self.__count <= self.window) or (current == self.window):
+            return prefix[..., column][()]
+        # The oldest samples of the window are the last ones of the previous block
+        return function(prefix[..., column], suffix[current][..., column])[()]
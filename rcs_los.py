@@ -0,0 +1,159 @@
+import sys
+import gdal, numpy
+from gdalconst import *
+from rcs import logger
+
+
+## @brief Line-of-sight engine over a Digital Surface Model (DSM) raster, which does not need the Morse simulator.
+# @details The segment between 2 robots is marched through the DSM pixels (at most 1 pixel per step, like a DDA):
+# the robots are not in line-of-sight if any surface along the segment is higher than the segment itself.
+# Many pairs are tested at once with Numpy (see batch_line_of_sight()), and the visibility of a fixed base station
+# can be precomputed for the whole map (see get_viewshed()).
+# @details Usage examples:
+# @code los = rcs_los.DSMLineOfSight('dsm.50cm.tif', antenna_height = 0.5)
+# r1r2 = rcs.RCS('robo1', 'robo2', model = "line_of_sight", los = los)    # no 'distance_and_view' requests
+# views = los.batch_line_of_sight(positions_r1, positions_r2)
+# base = los.get_viewshed((10, 101, 2))
+# base.is_visible((12, 101, 0.8)) @endcode
+# @note The DSM must be in the same UTM coordinates of the Path Loss Maps. The Morse coordinates are converted with the
+# custom origin of the file (metadata CUSTOM_X_ORIGIN, CUSTOM_Y_ORIGIN and CUSTOM_Z_ORIGIN), or 0 if it is not defined.
+class DSMLineOfSight():
+
+    ## @brief Maximum number of DSM samples read at a time by batch_line_of_sight() (limits the memory used).
+    __samples_per_chunk = 4000000
+
+    ## @param[in] filename DSM file (GeoTIFF with one band of surface heights).
+    # @param[in] antenna_height Height (meters) of the antennas above the robot poses.
+    # @exception Exit if the DSM file could not be opened.
+    def __init__(self, filename, antenna_height = 0.0):
+        dataset = gdal.Open(filename, GA_ReadOnly)
+        if dataset is None:
+            logger.error('\n\nDSM File "%s" could not be opened.\nBye...\n\n' %filename)
+            sys.exit(1)
+        metadata = dataset.GetMetadata()
+        geotransform = dataset.GetGeoTransform()
+        ## @brief Dictionary with the custom origin and the geotransform of the DSM (the same keys of rcs.get_plm_gdalinfo())
+        self.gdalinfo = {}
+        self.gdalinfo['X_custom_origin'] = float(metadata.get('CUSTOM_X_ORIGIN', 0))
+        self.gdalinfo['Y_custom_origin'] = float(metadata.get('CUSTOM_Y_ORIGIN', 0))
+        self.gdalinfo['Z_custom_origin'] = float(metadata.get('CUSTOM_Z_ORIGIN', 0))
+        self.gdalinfo['X_utm_origin'] = geotransform[0]
+        self.gdalinfo['Y_utm_origin'] = geotransform[3]
+        self.gdalinfo['X_scale'] = geotransform[1]
+        self.gdalinfo['Y_scale'] = geotransform[5]
+        ## @brief Number of columns and rows of the DSM
+        self.ncols = dataset.RasterXSize
+        self.nrows = dataset.RasterYSize
+        ## @brief Surface heights (float32 Numpy array)
+        self.dsm = dataset.GetRasterBand(1).ReadAsArray(0, 0, self.ncols, self.nrows).astype(numpy.float32)
+        ## @brief Height (meters) of the antennas above the robot poses
+        self.antenna_height = antenna_height
+        dataset = None
+
+    ## @param[in] pose_1 Dictionary (or sequence) with the coordinates x,y,z given by morse for one robot.
+    # @param[in] pose_2 Dictionary (or sequence) with the coordinates x,y,z given by morse for the other robot.
+    # @return A list with 2 arguments: distance between the 2 robots, line-of-sight (boolean),
+    # like the 'distance_and_view' service of Morse.
+    def distance_and_view(self, pose_1, pose_2):
+        p1 = self.__to_array(pose_1)
+        p2 = self.__to_array(pose_2)
+        return [float(numpy.sqrt(((p1 - p2) ** 2).sum())), bool(self.batch_line_of_sight(p1, p2)[0])]
+
+    ## @param[in] pose_1 Coordinates x,y,z of one robot.
+    # @param[in] pose_2 Coordinates x,y,z of the other robot.
+    # @return True (False) if the 2 robots are (not) in line-of-sight.
+    def line_of_sight(self, pose_1, pose_2):
+        return self.distance_and_view(pose_1, pose_2)[1]
+
+    ## @param[in] positions_1 Array (N x 3) with the Morse coordinates of one robot.
+    # @param[in] positions_2 Array (N x 3) with the Morse coordinates of the other robot.
+    # @return Boolean array: True (False) where the robots are (not) in line-of-sight.
+    # @details Samples outside the DSM do not block the line-of-sight.
+    def batch_line_of_sight(self, positions_1, positions_2):
+        p1 = numpy.atleast_2d(numpy.asarray(positions_1, dtype = float))
+        p2 = numpy.atleast_2d(numpy.asarray(positions_2, dtype = float))
+        c1, r1, z1 = self.__to_pixel(p1)
+        c2, r2, z2 = self.__to_pixel(p2)
+        steps = numpy.ceil(numpy.maximum(numpy.abs(c2 - c1), numpy.abs(r2 - r1))).astype(int) + 1
+
+        result = numpy.ones(len(steps), dtype = bool)
+        # Pairs with a similar number of steps are marched together, so the short ones are not oversampled
+        order = numpy.argsort(steps, kind = 'stable')
+        start = 0
+        while start < len(order):
+            # Upper bound of the steps of the chunk, so that it does not exceed the samples per chunk
+            guess = min(len(order), start + max(1, self.__samples_per_chunk // steps[order[start]]))
+            chunk = order[start:start + max(1, self.__samples_per_chunk // steps[order[guess-1]])]
+            k = steps[chunk[-1]]
+            # Interior samples only: the pixels under the robots themselves are not tested
+            t = numpy.arange(1, k) / float(k)
+            cols = numpy.floor(c1[chunk, None] + t * (c2 - c1)[chunk, None]).astype(int)
+            rows = numpy.floor(r1[chunk, None] + t * (r2 - r1)[chunk, None]).astype(int)
+            heights = z1[chunk, None] + t * (z2 - z1)[chunk, None]
+            inside = (cols >= 0) & (cols < self.ncols) & (rows >= 0) & (rows < self.nrows)
+            surface = numpy.full(cols.shape, -numpy.inf, dtype = numpy.float32)
+            surface[inside] = self.dsm[rows[inside], cols[inside]]
+            result[chunk] = ~(surface > heights).any(axis = 1)
+            start += len(chunk)
+        return result
+
+    ## @param[in] position Coordinates x,y,z (Morse) of a fixed base station.
+    # @param[in] target_height Height (meters) of the targets above the surface (default: the antenna height).
+    # @return A Viewshed with the visibility of every DSM pixel from the base station.
+    def get_viewshed(self, position, target_height = None):
+        if target_height is None:
+            target_height = self.antenna_height
+        g = self.gdalinfo
+        rows, cols = numpy.mgrid[0:self.nrows, 0:self.ncols]
+        # Center of each pixel, in Morse coordinates (the antenna height is added again by batch_line_of_sight())
+        targets = numpy.empty((self.nrows * self.ncols, 3))
+        targets[:, 0] = g['X_utm_origin'] + (cols.ravel() + 0.5) * g['X_scale'] - g['X_custom_origin']
+        targets[:, 1] = g['Y_utm_origin'] + (rows.ravel() + 0.5) * g['Y_scale'] - g['Y_custom_origin']
+        targets[:, 2] = self.dsm.ravel() + target_height - self.antenna_height - g['Z_custom_origin']
+        base = numpy.tile(numpy.asarray(position, dtype = float), (len(targets), 1))
+        visible = self.batch_line_of_sight(base, targets).reshape(self.nrows, self.ncols)
+        logger.info("DSM viewshed from %s: %.1f%% of the map is visible" %(tuple(position), 100.0 * visible.mean()))
+        return Viewshed(self.gdalinfo, visible)
+
+    ## @param[in] positions Array (N x 3) with Morse coordinates.
+    # @return Tuple with 3 float arrays: the pixel coordinates x (columns), y (rows) and the antenna heights (DSM units).
+    def __to_pixel(self, positions):
+        g = self.gdalinfo
+        cols = (positions[:, 0] + g['X_custom_origin'] - g['X_utm_origin']) / g['X_scale']
+        rows = (positions[:, 1] + g['Y_custom_origin'] - g['Y_utm_origin']) / g['Y_scale']
+        heights = positions[:, 2] + g['Z_custom_origin'] + self.antenna_height
+        return cols, rows, heights
+
+    ## @param[in] pose Dictionary (x,y,z) or sequence with the coordinates of a robot.
+    # @return Numpy array with the coordinates x,y,z.
+    def __to_array(self, pose):
+        if isinstance(pose, dict):
+            return numpy.array([pose['x'], pose['y'], pose['z']], dtype = float)
+        return numpy.asarray(pose, dtype = float)
+
+
+## @brief Precomputed visibility of a fixed base station over a DSM (see DSMLineOfSight.get_viewshed()).
+class Viewshed():
+
+    ## @param[in] gdalinfo Dictionary with the custom origin and the geotransform of the DSM.
+    # @param[in] visible Boolean Numpy array: True (False) where the pixel is (not) visible from the base station.
+    def __init__(self, gdalinfo, visible):
+        self.gdalinfo = gdalinfo
+        self.visible = visible
+
+    ## @param[in] position Coordinates x,y(,z) (Morse) of a robot.
+    # @return True (False) if the robot is (not) visible from the base station.
+    def is_visible(self, position):
+        return bool(self.batch_is_visible(numpy.atleast_2d(position))[0])
+
+    ## @param[in] positions Array (N x 2 or N x 3) with Morse coordinates.
+    # @return Boolean array: True (False) where the robot is (not) visible. Positions outside the DSM are not visible.
+    def batch_is_visible(self, positions):
+        g = self.gdalinfo
+        positions = numpy.asarray(positions, dtype = float)
+        cols = numpy.floor((positions[:, 0] + g['X_custom_origin'] - g['X_utm_origin']) / g['X_scale']).astype(int)
+        rows = numpy.floor((positions[:, 1] + g['Y_custom_origin'] - g['Y_utm_origin']) / g['Y_scale']).astype(int)
+        inside = (cols >= 0) & (cols < self.visible.shape[1]) & (rows >= 0) & (rows < self.visible.shape[0])
+        result = numpy.zeros(len(positions), dtype = bool)
+        result[inside] = self.visible[rows[inside], cols[inside]]
+        return result
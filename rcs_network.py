@@ -0,0 +1,279 @@
+import sys
+import numpy
+import rcs, rcs_spatial
+from rcs import logger
+
+
+## @brief This class aims to simulate which robots of a fleet can communicate each other, according to the models of @ref rcs.RCS.
+# @details Instead of one RCS instance (and one Morse connection) per pair of robots, the whole fleet is handled by one instance:
+# the robots and their pose sensors are discovered once, every pose is read once per update() and the results of all
+# the pairs are returned at once as N x N matrices (rows and columns follow the order of get_robots()).
+# @details Usage examples:
+# @code fleet = rcs_network.RCSNetwork(model = "distance", distance_threshold = 15)
+# fleet = rcs_network.RCSNetwork(['robo1', 'robo2', 'robo3'], model = 'plm', plm = parameters)
+# links = fleet.can_communicate()      # links[i][j] --> robots get_robots()[i] and get_robots()[j]
+# i, j = fleet.get_links()             # only the pairs that can communicate (large fleets)
+# fleet.get_neighbours('robo1', update = False) @endcode
+# @note The diagonal of the matrices (a robot with itself) is always 0.
+class RCSNetwork():
+
+    ## @param[in] robots List with the names of the robots. If None, all the robots of the current Scene are used.
+    # @param[in] kwargs See the method @ref rcs.RCS.set_model_specifications() for more information.
+    def __init__(self, robots = None, **kwargs):
+
+        ## @brief Morse connection: access to Morse services and data streams (shared, see rcs.MorsePool)
+        self.__morse = rcs.morse_pool.acquire()
+        ## @brief List with the names of the robots
+        self.__robots = None
+        ## @brief Dictionary with the name of the Pose sensor of each robot
+        self.__pose_sensors = self.__verify_robots_names_and_pose_sensors(robots)
+        ## @brief Positions (x,y,z) of the robots in the last update() (N x 3 Numpy array)
+        self.__positions = None
+        ## @brief Model specifications, with the same keys of rcs.RCS.set_model_specifications()
+        self.__specifications = rcs.RCS.get_default_specifications()
+        ## @brief Spatial index of the positions (see get_links()), built again when the positions change
+        self.__grid = None
+        ## @brief Time series of the results of the pairs (opt-in, see set_history())
+        self.__history = None
+
+        self.set_model_specifications(**kwargs)
+
+    ## @details This method releases the connection with the  morse simulation (it is closed by its last user).
+    def __del__(self):
+        self.__morse.close()
+
+    ## @return List with the names of the robots, in the order of the rows (and columns) of the matrices.
+    def get_robots(self):
+        return list(self.__robots)
+
+    ## @brief This method sets a communication model and its specifications for all the pairs of robots.
+    # @param[in] kwargs The same arguments of @ref rcs.RCS.set_model_specifications().
+    # @details Default values are established in case the respective arguments are wrongly (or not) passed.
+    def set_model_specifications(self, **kwargs):
+
+        if ("model" in kwargs) and rcs.RCS.model_exists(kwargs["model"]):
+            self.__specifications['model'] = kwargs["model"].lower()
+        for key in ('distance_threshold', 'freq', 'free_space_threshold') + tuple(rcs.models.get_defaults()):
+            if key in kwargs:
+                self.__specifications[key] = kwargs[key]
+        if ("plm" in kwargs) and rcs.RCS.check_plm_dictionary(kwargs["plm"]):
+            self.__specifications['plm'] = kwargs["plm"]
+        if ("plm_sampling" in kwargs) and rcs.plm_cache.sampling_exists(kwargs["plm_sampling"]):
+            self.__specifications['plm_sampling'] = kwargs["plm_sampling"]
+        if ("los" in kwargs) and ((kwargs["los"] is None) or hasattr(kwargs["los"], 'batch_line_of_sight')):
+            self.__specifications['los'] = kwargs["los"]
+
+        logger.info("Communication model of the network %s: %s" %(self.__robots, self.get_model_specifications(True)))
+
+    ## @return Dictionary with the current model specifications, using the same keys of rcs.RCS.set_model_specifications().
+    def get_specifications(self):
+        specifications = dict(self.__specifications)
+        specifications['plm'] = dict(specifications['plm'])
+        return specifications
+
+    ## @param[in] spec Boolean to return or not the current model specifications.
+    # @return A string with the communication model currently established and its current specifications if spec is true.
+    def get_model_specifications(self, spec):
+        s = self.__specifications
+        if spec is False:
+            return s['model']
+        else:
+            return rcs.models.get(s['model']).describe(s)
+
+    ## @brief Reads the pose of every robot (one read per robot, see rcs.MorseSnapshot).
+    # @return The positions (x,y,z) of the robots (N x 3 Numpy array).
+    def update(self):
+        positions = numpy.empty((len(self.__robots), 3))
+        for i, robot in enumerate(self.__robots):
+            pose = rcs.snapshot.get_pose(self.__morse, robot, self.__pose_sensors[robot])
+            positions[i] = (pose['x'], pose['y'], pose['z'])
+        self.__positions = positions
+        return positions
+
+    ## @param[in] update Boolean to read (or not) the poses of the robots before the computation.
+    # @return N x N Numpy array: 1 (0) if each pair of robots can (cannot) communicate according to the established model.
+    # @exception For the Path Loss Map model, it returns the Data Rate (Mb/s) of each pair.
+    # @details Each pair is evaluated once, with rcs.CommunicationModel.batch_evaluate() of the model.
+    def can_communicate(self, update = True):
+        if update or (self.__positions is None):
+            self.update()
+
+        s = self.__specifications
+        n = len(self.__robots)
+        i, j = numpy.triu_indices(n, 1)
+        model = rcs.models.get(s['model'])
+        values = numpy.asarray(model.batch_evaluate(s, self.__get_inputs(model, i, j)))
+        result = numpy.zeros((n, n), dtype = values.dtype)
+        result[i, j] = result[j, i] = values
+        if self.__history is not None:
+            distances = rcs.batch_distance(self.__positions[i], self.__positions[j])
+            self.__history.append(distances, rcs.batch_free_space_loss(distances, s['freq']), values)
+
+        logger.info("RCS network: %i of %i pairs can communicate (%s)"\
+                %(numpy.count_nonzero(numpy.triu(result)), len(self.__robots)*(len(self.__robots)-1)//2, s['model'].upper()))
+        return result
+
+    ## @param[in] history Time series (e.g. @ref rcs_history.LinkHistory with the shape (P,), P = N*(N-1)/2) where the results of the pairs
+    # (i < j, in the order of numpy.triu_indices(N, 1)) are appended by each can_communicate(), with their distances and
+    # free space path losses. None to stop recording.
+    # @exception Exit if the shape of the history is not the number of pairs.
+    def set_history(self, history):
+        pairs = len(self.__robots)*(len(self.__robots)-1)//2
+        if (history is not None) and (tuple(history.shape) != (pairs,)):
+            logger.error('\n\nThe Link History has the shape %s, not (%i,) (pairs of robots).\nBye...\n\n' %(tuple(history.shape), pairs))
+            sys.exit(1)
+        self.__history = history
+
+    ## @return The time series given to set_history(), or None.
+    def get_history(self):
+        return self.__history
+
+    ## @param[in] update Boolean to read (or not) the poses of the robots before the computation.
+    # @return N x N Numpy array with the distance (meters) between each pair of robots.
+    # @note The distances are computed from the Pose sensors, so they may differ slightly from the
+    # 'distance_and_view' service used by rcs.RCS, which measures between the robot objects.
+    def get_distance_matrix(self, update = True):
+        if update or (self.__positions is None):
+            self.update()
+        return rcs.batch_distance(self.__positions[:, numpy.newaxis, :], self.__positions[numpy.newaxis, :, :])
+
+    ## @param[in] update Boolean to read (or not) the poses of the robots before the computation.
+    # @return N x N Numpy array with the free space path loss (dB) between each pair of robots.
+    # @see rcs.batch_free_space_loss()
+    def get_loss_matrix(self, update = True):
+        loss = rcs.batch_free_space_loss(self.get_distance_matrix(update), self.__specifications['freq'])
+        numpy.fill_diagonal(loss, 0)
+        return loss
+
+    ## @param[in] update Boolean to read (or not) the poses of the robots before the computation (only for a local line-of-sight engine).
+    # @return N x N Numpy array: True (False) if each pair of robots is (not) in line-of-sight.
+    # @details With a local line-of-sight engine ('los' specification, e.g. rcs_los.DSMLineOfSight), all the pairs are tested at once from the poses.
+    # Otherwise, one 'distance_and_view' request is sent to Morse per pair of robots. All the requests are sent
+    # before waiting for the responses, so the whole matrix takes about one round trip instead of one per pair.
+    def get_lineofsight_matrix(self, update = True):
+        n = len(self.__robots)
+        result = numpy.zeros((n, n), dtype = bool)
+        if self.__specifications['los'] is not None:
+            if update or (self.__positions is None):
+                self.update()
+            i, j = numpy.triu_indices(n, 1)
+            result[i, j] = result[j, i] = self.__specifications['los'].batch_line_of_sight(self.__positions[i], self.__positions[j])
+            return result
+
+        futures = {}
+        for i in range(n):
+            for j in range(i+1, n):
+                key = rcs.snapshot.distance_and_view_key(self.__morse, self.__robots[i], self.__robots[j])
+                view = rcs.snapshot.lookup(key)
+                if view is None:
+                    futures[(i, j)] = (key, self.__morse.rpc_future('communication', 'distance_and_view', self.__robots[i], self.__robots[j]))
+                else:
+                    result[i][j] = result[j][i] = view[1]
+        for (i, j), (key, future) in futures.items():
+            try:
+                view = future.result()
+                rcs.snapshot.store(key, view)
+                result[i][j] = result[j][i] = view[1]
+            except rcs.pymorse.MorseServerError as mse:
+                logger.error('Oups! An error occurred! %s', mse)
+        return result
+
+    ## @param[in] update Boolean to read (or not) the poses of the robots before the computation.
+    # @return N x N Numpy array with the Data Rate (Mb/s) of each pair of robots, according to the Path Loss Map model.
+    # @details The path loss under each robot is sampled once, and each pair takes the maximum of its 2 path losses.
+    # @note The Path Loss Map files must have this format: 'plm_'+robotname+'.tif' (see rcs.RCS).
+    def get_data_rate_matrix(self, update = True):
+        if update or (self.__positions is None):
+            self.update()
+
+        n = len(self.__robots)
+        i, j = numpy.triu_indices(n, 1)
+        model = rcs.models.get('plm')
+        values = numpy.asarray(model.batch_evaluate(self.__specifications, self.__get_inputs(model, i, j)))
+        result = numpy.zeros((n, n), dtype = values.dtype)
+        result[i, j] = result[j, i] = values
+        return result
+
+    ## @return The distance (meters) below which 2 robots can communicate with the established model (e.g. 'distance' or 'free_space_loss'),
+    # or None if the model does not depend only on the distance.
+    # @see rcs.CommunicationModel.get_cutoff_distance()
+    def get_cutoff_distance(self):
+        s = self.__specifications
+        return rcs.models.get(s['model']).get_cutoff_distance(s)
+
+    ## @param[in] update Boolean to read (or not) the poses of the robots before the computation.
+    # @return Tuple with 2 arrays: the indices i and j (i < j, see get_robots()) of the pairs of robots that can communicate.
+    # @details For the models with a cutoff distance (see get_cutoff_distance()), only the robots closer than it
+    # are tested, through a spatial index (rcs_spatial.SpatialGrid), instead of the N x N pairs. The other models use can_communicate().
+    def get_links(self, update = True):
+        if update or (self.__positions is None):
+            self.update()
+        cutoff = self.get_cutoff_distance()
+        if cutoff is None:
+            i, j = numpy.nonzero(numpy.triu(self.can_communicate(False), 1))
+            return i, j
+        if cutoff <= 0:
+            return numpy.zeros(0, dtype = int), numpy.zeros(0, dtype = int)
+
+        # Small margin, so the free space loss is still compared with its own threshold
+        radius = cutoff * (1 + 1e-9)
+        if (self.__grid is None) or (self.__grid.positions is not self.__positions):
+            self.__grid = rcs_spatial.SpatialGrid(radius)
+            self.__grid.build(self.__positions)
+        i, j, distances = self.__grid.query_pairs(radius)
+        s = self.__specifications
+        keep = rcs.models.get(s['model']).batch_evaluate(s, {'robots': self.__robots, 'pairs': (i, j), 'distance': distances}).astype(bool)
+        order = numpy.lexsort((j[keep], i[keep]))
+        return i[keep][order], j[keep][order]
+
+    ## @param[in] robot Name of the robot.
+    # @param[in] update Boolean to read (or not) the poses of the robots before the computation.
+    # @return List with the names of the robots that can communicate with the robot (see get_links()).
+    def get_neighbours(self, robot, update = True):
+        k = self.__robots.index(robot)
+        i, j = self.get_links(update)
+        return [self.__robots[n] for n in sorted(numpy.concatenate((j[i == k], i[j == k])).tolist())]
+
+    ## @param[in] model rcs.CommunicationModel.
+    # @param[in] i Array with the indices of one robot of each pair.
+    # @param[in] j Array with the indices of the other robot of each pair.
+    # @return Dictionary with the inputs of rcs.CommunicationModel.batch_evaluate() needed by the model, for the pairs (i, j).
+    def __get_inputs(self, model, i, j):
+        inputs = {'robots': self.__robots, 'pairs': (i, j), 'positions': self.__positions}
+        if 'distance' in model.inputs:
+            inputs['distance'] = rcs.batch_distance(self.__positions[i], self.__positions[j])
+        if 'line_of_sight' in model.inputs:
+            inputs['line_of_sight'] = self.get_lineofsight_matrix(False)[i, j]
+        return inputs
+
+    ## @param[in] robots List with the names of the robots given in the __init(), or None for all the robots.
+    # @return Dictionary with the name of the Pose sensor of each robot.
+    # @exception Exit if any robot name does not exist in the current Scene 3D.
+    # @exception Exit if any pose sensor (1 per robot) was not included.
+    # @details The pose sensor name of each robot must have the word "pose" inside - no matter if with upper or lower letters.
+    def __verify_robots_names_and_pose_sensors(self, robots):
+
+        r_names = self.__morse.rpc('simulation', 'list_robots')
+        streams = self.__morse.rpc('simulation', 'list_streams')
+
+        if robots is None:
+            robots = sorted(r_names)
+        for robot in robots:
+            if robot not in r_names:
+                logger.error('\n\nThe robot name "%s" does not exist in the current Scene.\nBye...\n\n' %robot)
+                sys.exit(0)
+        self.__robots = list(robots)
+        logger.info('Robots Names are correct! :)')
+
+        result = {}
+        for word in streams:
+            temp = word.split('.')
+            if (temp[0] in self.__robots) and ((word.lower()).find('pose') != -1):
+                result[temp[0]] = temp[1]
+        for robot in self.__robots:
+            if robot not in result:
+                logger.error('\n\nThe robot "%s" was not configured with a POSE sensor.\nBye\n\n' %robot)
+                sys.exit(0)
+
+        logger.info('Robots Pose Sensors found! :)')
+        return result
@@ -0,0 +1,117 @@
+import numpy
+
+
+## @brief Uniform grid over the positions of a fleet, to find the pairs of robots closer than a radius without testing all of them.
+# @details The robots are sorted by cell (x,y) once per build(). A query only tests the robots of the 3 x 3 cells around each robot,
+# so, with a cell size equal to the radius, the cost grows with the number of robots and of close pairs, not with N x N.
+# The distances are measured in 3D (the z coordinate does not change the cells, since it can only increase the distance).
+# @details Usage examples:
+# @code grid = rcs_spatial.SpatialGrid(15)
+# grid.build(positions)                   # N x 3 array, once per tick
+# i, j, d = grid.query_pairs(15)          # pairs (i < j) closer than 15 meters
+# k, d = grid.query_point(positions[0], 15) @endcode
+class SpatialGrid():
+
+    ## @brief Offsets (x,y) of the neighbour cells tested by query_pairs(): half of the 3 x 3 cells, so each pair of cells is tested once.
+    __half_neighbourhood = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+    ## @param[in] cell_size Units: meters. Size of the cells (usually the radius of the queries).
+    def __init__(self, cell_size):
+        ## @brief Units: meters
+        self.cell_size = float(cell_size)
+        ## @brief Positions (N x 3) of the last build()
+        self.positions = None
+        self.__order = None
+        self.__keys = None
+        self.__starts = None
+        self.__counts = None
+        self.__rows = None
+        self.__origin = None
+
+    ## @param[in] positions Array (N x 2 or N x 3) with the positions of the robots.
+    def build(self, positions):
+        positions = numpy.atleast_2d(numpy.asarray(positions, dtype = float))
+        self.positions = positions
+        cells = numpy.floor(positions[:, :2] / self.cell_size).astype(numpy.int64)
+        if len(cells):
+            self.__origin = cells.min(axis = 0) - 1
+            # Room for the neighbours of the last row, so the keys of (x+1, y-1) and (x, y+1) never overlap
+            self.__rows = int(cells[:, 1].max() - self.__origin[1]) + 2
+        else:
+            self.__origin = numpy.zeros(2, dtype = numpy.int64)
+            self.__rows = 1
+        keys = self.__cell_keys(cells)
+        self.__order = numpy.argsort(keys, kind = 'stable')
+        self.__keys, self.__starts, self.__counts = numpy.unique(keys[self.__order], return_index = True, return_counts = True)
+
+    ## @param[in] radius Units: meters. Maximum distance (exclusive). By default, the cell size.
+    # @return Tuple with 3 arrays: the indices i and j (i < j) of the robots of each pair closer than the radius, and their distances.
+    def query_pairs(self, radius = None):
+        radius = self.__check_radius(radius)
+        order = self.__order
+        n = len(order)
+        cell_of = numpy.repeat(numpy.arange(len(self.__keys)), self.__counts)
+        first = []; second = []
+        for dx, dy in self.__half_neighbourhood:
+            neighbours = self.__find_cells(self.__keys + dx * self.__rows + dy)
+            valid = neighbours >= 0
+            # Candidates of each robot (sorted by cell): all the robots of the neighbour cell
+            counts = numpy.where(valid, self.__counts[neighbours], 0)[cell_of]
+            starts = self.__starts[neighbours][cell_of]
+            i = numpy.repeat(numpy.arange(n), counts)
+            offsets = numpy.arange(len(i)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+            j = numpy.repeat(starts, counts) + offsets
+            if (dx, dy) == (0, 0):
+                keep = j > i
+                i = i[keep]; j = j[keep]
+            first.append(i); second.append(j)
+        i = order[numpy.concatenate(first)]
+        j = order[numpy.concatenate(second)]
+        distances = numpy.sqrt(((self.positions[i] - self.positions[j]) ** 2).sum(axis = 1))
+        close = distances < radius
+        i, j, distances = i[close], j[close], distances[close]
+        swap = i > j
+        i[swap], j[swap] = j[swap], i[swap].copy()
+        return i, j, distances
+
+    ## @param[in] position Coordinates x,y(,z) of a point (e.g. the position of a robot).
+    # @param[in] radius Units: meters. Maximum distance (exclusive). By default, the cell size.
+    # @return Tuple with 2 arrays: the indices of the robots closer than the radius to the point, and their distances.
+    def query_point(self, position, radius = None):
+        radius = self.__check_radius(radius)
+        position = numpy.zeros(self.positions.shape[1]) + numpy.asarray(position, dtype = float)[:self.positions.shape[1]]
+        cell = numpy.floor(position[:2] / self.cell_size).astype(numpy.int64)
+        keys = [self.__cell_keys(cell + (dx, dy)) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+        candidates = [self.__order[self.__starts[k]:self.__starts[k] + self.__counts[k]] for k in self.__find_cells(numpy.array(keys)) if k >= 0]
+        if not candidates:
+            return numpy.zeros(0, dtype = int), numpy.zeros(0)
+        candidates = numpy.concatenate(candidates)
+        distances = numpy.sqrt(((self.positions[candidates] - position) ** 2).sum(axis = 1))
+        close = distances < radius
+        return candidates[close], distances[close]
+
+    ## @param[in] cells Array (... x 2) with the cells (x,y).
+    # @return Array with the key of each cell (cells outside the built area get keys that do not exist).
+    def __cell_keys(self, cells):
+        cells = numpy.asarray(cells, dtype = numpy.int64) - self.__origin
+        inside = (cells[..., 1] >= 0) & (cells[..., 1] < self.__rows)
+        return numpy.where(inside, cells[..., 0] * self.__rows + cells[..., 1], -1)
+
+    ## @param[in] keys Array with cell keys.
+    # @return Array with the index of each cell in the occupied cells, or -1 if it has no robots.
+    def __find_cells(self, keys):
+        if len(self.__keys) == 0:
+            return numpy.full(numpy.shape(keys), -1)
+        index = numpy.minimum(numpy.searchsorted(self.__keys, keys), len(self.__keys) - 1)
+        return numpy.where(self.__keys[index] == keys, index, -1)
+
+    ## @param[in] radius Units: meters, or None for the cell size.
+    # @return The radius of the query.
+    # @details If the radius is larger than the cell size, the grid is built again with cells of the size of the radius (otherwise pairs would be missed).
+    def __check_radius(self, radius):
+        if radius is None:
+            return self.cell_size
+        if radius > self.cell_size:
+            self.cell_size = float(radius)
+            self.build(self.positions)
+        return radius
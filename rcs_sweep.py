@@ -0,0 +1,182 @@
+import sys, math
+import multiprocessing
+from multiprocessing import shared_memory
+import gdal, numpy
+from gdalconst import *
+import rcs
+from rcs import logger
+
+
+## @brief Coverage of a base station: Data Rate (Mb/s) of the Path Loss Map model for a robot in each cell of a grid (see sweep_coverage()).
+class Coverage():
+
+    ## @param[in] data_rates float32 Numpy array (rows x columns) with the Data Rate of each cell.
+    # @param[in] geotransform GDAL geotransform of the grid (UTM coordinates).
+    # @param[in] projection Projection (WKT) of the grid.
+    # @param[in] metadata Dictionary with the metadata of the grid (the custom origin of the Path Loss Map).
+    def __init__(self, data_rates, geotransform, projection, metadata):
+        self.data_rates = data_rates
+        self.geotransform = geotransform
+        self.projection = projection
+        self.metadata = metadata
+
+    ## @return Boolean Numpy array: True where the robot can communicate with the base station (Data Rate > 0).
+    def get_coverage(self):
+        return self.data_rates > 0
+
+    ## @param[in] filename Name of the float32 GeoTIFF file to be created, with the georeferencing of the grid.
+    # @return True (False) if the file was (not) created.
+    def save(self, filename):
+        nrows, ncols = self.data_rates.shape
+        dataset = gdal.GetDriverByName('GTiff').Create(filename, ncols, nrows, 1, gdal.GDT_Float32)
+        if dataset is None:
+            logger.error('Coverage File "%s" could not be created.' %filename)
+            return False
+        dataset.SetGeoTransform(self.geotransform)
+        dataset.SetProjection(self.projection)
+        dataset.SetMetadata(self.metadata)
+        dataset.GetRasterBand(1).WriteArray(self.data_rates, 0, 0)
+        dataset.FlushCache()
+        dataset = None
+        return True
+
+
+## @brief Evaluates the Path Loss Map model between a base station and a robot placed in each cell of a grid, in several processes.
+# @param[in] base_position Morse coordinates x,y(,z) of the base station.
+# @param[in] base_filename Path Loss Map file of the base station ('plm_'+robotname+'.tif').
+# @param[in] robot_filename Path Loss Map file of the robot. The grid covers this map.
+# @param[in] plm Dictionary with the parameters of the Path Loss Map model (see rcs.RCS.check_plm_dictionary()).
+# @param[in] scale Units: meters. Size of the cells of the grid (default: the pixel size of the robot map).
+# @param[in] processes Number of worker processes (default: the number of CPUs). With 1, the grid is evaluated in this process.
+# @param[in] rows_per_task Number of rows of the grid evaluated by each task.
+# @return A Coverage, with the georeferencing of the robot map (cells outside the map have a Data Rate of 0).
+# @exception Exit if a Path Loss Map file could not be opened.
+# @details The robot map and the result are kept in shared memory (multiprocessing.shared_memory): the workers read and write
+# them in place, so the rasters are never copied to (or pickled for) each process.
+# @details Usage examples:
+# @code coverage = rcs_sweep.sweep_coverage((10, 101, 2), 'plm_base.tif', 'plm_robo1.tif', parameters, scale = 1.0)
+# coverage.save('coverage_robo1.tif') @endcode
+def sweep_coverage(base_position, base_filename, robot_filename, plm, scale = None, processes = None, rows_per_task = 256):
+    base_pathloss = float(rcs.batch_pathloss(base_filename, numpy.atleast_2d(base_position))[0])
+    raster = rcs.plm_cache.get(robot_filename, 'full')
+    dataset = gdal.Open(robot_filename, GA_ReadOnly)
+    if (raster is None) or (dataset is None):
+        logger.error('\n\nPath Loss Map File "%s" could not be opened.\nBye...\n\n' %robot_filename)
+        sys.exit(1)
+    g = raster.gdalinfo
+    if scale is None:
+        scale = g['X_scale']
+    ncols = int(math.ceil(raster.ncols * g['X_scale'] / scale))
+    nrows = int(math.ceil(raster.nrows * abs(g['Y_scale']) / scale))
+    geotransform = (g['X_utm_origin'], scale, 0, g['Y_utm_origin'], 0, -scale)
+    grid = {'ncols': ncols, 'nrows': nrows, 'geotransform': geotransform, 'gdalinfo': g,
+            'base_pathloss': base_pathloss, 'plm': dict(plm)}
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    tasks = [(row, min(row + rows_per_task, nrows)) for row in range(0, nrows, rows_per_task)]
+    if processes <= 1:
+        data_rates = numpy.empty((nrows, ncols), dtype = numpy.float32)
+        for task in tasks:
+            evaluate_rows(task, grid, raster.map_data, data_rates)
+    else:
+        data_rates = sweep_shared(tasks, grid, raster.map_data, processes)
+
+    logger.info("PLM sweep: %i x %i cells, %.1f%% covered by the base station at %s"\
+            %(ncols, nrows, 100.0 * numpy.count_nonzero(data_rates) / data_rates.size, tuple(base_position)))
+    coverage = Coverage(data_rates, geotransform, dataset.GetProjection(), dataset.GetMetadata())
+    dataset = None
+    return coverage
+
+
+## @brief Evaluates the Path Loss Map model between a base station and a robot placed in each pixel of the robot map, with the
+# min/max pyramid of the map (see rcs.PLMPyramidRaster).
+# @param[in] base_position Morse coordinates x,y(,z) of the base station.
+# @param[in] base_filename Path Loss Map file of the base station ('plm_'+robotname+'.tif').
+# @param[in] robot_filename Path Loss Map file of the robot. The grid is the grid of this map.
+# @param[in] plm Dictionary with the parameters of the Path Loss Map model (see rcs.RCS.check_plm_dictionary()).
+# @return A Coverage, with the georeferencing of the robot map.
+# @exception Exit if a Path Loss Map file could not be opened.
+# @details The regions of the map whose path losses are all in one Data Rate class, or all below the class of the base station,
+# are filled at once from the coarsest level of the pyramid where this holds: only the pixels of the regions that straddle
+# a threshold are read. The result is the one of sweep_coverage() (with the default scale) and the 'pyramid' sampling.
+def pyramid_coverage(base_position, base_filename, robot_filename, plm):
+    thresholds = (plm['t1'], plm['t2'], plm['t3'])
+    base_class = int(rcs.batch_plm_classes(base_filename, numpy.atleast_2d(base_position), plm, 'pyramid')[0])
+    pyramid = rcs.plm_cache.get(robot_filename, 'pyramid', thresholds)
+    dataset = gdal.Open(robot_filename, GA_ReadOnly)
+    if (pyramid is None) or (dataset is None):
+        logger.error('\n\nPath Loss Map File "%s" could not be opened.\nBye...\n\n' %robot_filename)
+        sys.exit(1)
+    # The Data Rate of a pair only depends on the maximum of their classes
+    data_rates = rcs.get_plm_rate_table(plm)[base_class][pyramid.get_class_map(base_class)].astype(numpy.float32)
+
+    logger.info("PLM pyramid sweep: %i x %i cells, %.1f%% covered by the base station at %s"\
+            %(pyramid.ncols, pyramid.nrows, 100.0 * numpy.count_nonzero(data_rates) / data_rates.size, tuple(base_position)))
+    coverage = Coverage(data_rates, dataset.GetGeoTransform(), dataset.GetProjection(), dataset.GetMetadata())
+    dataset = None
+    return coverage
+
+
+## @param[in] tasks List with the ranges of rows (first, last + 1) of each task.
+# @param[in] grid Dictionary with the description of the grid (see sweep_coverage()).
+# @param[in] map_data Numpy array with the path losses of the robot map.
+# @param[in] processes Number of worker processes.
+# @return float32 Numpy array with the Data Rates of the grid.
+def sweep_shared(tasks, grid, map_data, processes):
+    shape = (grid['nrows'], grid['ncols'])
+    source = shared_memory.SharedMemory(create = True, size = max(1, map_data.nbytes))
+    output = shared_memory.SharedMemory(create = True, size = max(1, shape[0] * shape[1] * 4))
+    try:
+        numpy.ndarray(map_data.shape, dtype = map_data.dtype, buffer = source.buf)[:] = map_data
+        rasters = ((source.name, map_data.shape, map_data.dtype.str), (output.name, shape, numpy.dtype(numpy.float32).str))
+        with multiprocessing.Pool(processes, initializer = attach_worker, initargs = (grid, rasters)) as pool:
+            pool.map(evaluate_task, tasks)
+        return numpy.ndarray(shape, dtype = numpy.float32, buffer = output.buf).copy()
+    finally:
+        source.close(); source.unlink()
+        output.close(); output.unlink()
+
+
+## @brief State of a worker process: the grid and the shared rasters (see attach_worker()).
+worker_state = {}
+
+
+## @brief Initializer of the worker processes: attaches the shared rasters.
+# @param[in] grid Dictionary with the description of the grid.
+# @param[in] rasters Tuple with (name, shape, dtype) of the shared memory of the robot map and of the result.
+def attach_worker(grid, rasters):
+    arrays = []
+    for name, shape, dtype in rasters:
+        # The parent process owns (and unlinks) the shared memory
+        memory = shared_memory.SharedMemory(name = name)
+        arrays.append(numpy.ndarray(shape, dtype = dtype, buffer = memory.buf))
+        worker_state.setdefault('memories', []).append(memory)
+    worker_state['grid'] = grid
+    worker_state['map_data'], worker_state['data_rates'] = arrays
+
+
+## @param[in] task Range of rows (first, last + 1) of the grid.
+def evaluate_task(task):
+    evaluate_rows(task, worker_state['grid'], worker_state['map_data'], worker_state['data_rates'])
+
+
+## @brief Evaluates the Path Loss Map model in some rows of the grid.
+# @param[in] task Range of rows (first, last + 1) of the grid.
+# @param[in] grid Dictionary with the description of the grid.
+# @param[in] map_data Numpy array with the path losses of the robot map.
+# @param[out] data_rates Numpy array where the Data Rates of the rows are written.
+def evaluate_rows(task, grid, map_data, data_rates):
+    g = grid['gdalinfo']
+    geotransform = grid['geotransform']
+    rows, cols = numpy.mgrid[task[0]:task[1], 0:grid['ncols']]
+    # Center of each cell, in Morse coordinates
+    positions = numpy.empty(rows.shape + (2,))
+    positions[..., 0] = geotransform[0] + (cols + 0.5) * geotransform[1] - g['X_custom_origin']
+    positions[..., 1] = geotransform[3] + (rows + 0.5) * geotransform[5] - g['Y_custom_origin']
+    x, y = rcs.batch_pixel_coordinates(g, positions)
+    inside = (x >= 0) & (x < map_data.shape[1]) & (y >= 0) & (y < map_data.shape[0])
+    pathlosses = numpy.full(rows.shape, numpy.nan, dtype = numpy.float32)
+    pathlosses[inside] = map_data[y[inside], x[inside]]
+    pathlosses = numpy.maximum(pathlosses, grid['base_pathloss'])
+    data_rates[task[0]:task[1]] = rcs.batch_data_rate(pathlosses, grid['plm'])
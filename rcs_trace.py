@@ -0,0 +1,246 @@
+import os, time, json
+import numpy
+import rcs
+from rcs import logger
+
+
+## @brief This class records the inputs of the communication models of a fleet (see rcs_network.RCSNetwork) in a binary trace.
+# @details On each record(), the poses of the robots are read once and these columns are appended (P pairs of robots, in the order of get_pairs()):
+# - 'time' (float64): seconds since the epoch,
+# - 'positions' (float64, N x 3): positions x,y,z of the robots,
+# - 'distance' (float64, P): distance (meters) between the robots,
+# - 'loss' (float32, P): free space path loss (dB) at the frequency of the network,
+# - 'line_of_sight' (bool, P): only if line_of_sight is True,
+# - 'pathloss' (float32, P) and 'data_rate' (float32, P): maximum path loss of the 2 robots and its Data Rate (Mb/s) with the
+# Path Loss Map parameters of the network, only if plm is True.
+# @details The columns are kept in memory and saved every chunk_ticks ticks as Numpy files ('<column>.<chunk>.npy'), so the
+# trace is written in large sequential blocks and can be read again with memory maps (see TraceReplay).
+# The description of the trace ('trace.json') is written with each chunk, so a trace is readable even if the run is interrupted.
+# @details Usage examples:
+# @code fleet = rcs_network.RCSNetwork(model = 'plm', plm = parameters)
+# recorder = rcs_trace.TraceRecorder('mission_1', fleet, line_of_sight = False)
+# while running:
+#     recorder.record()
+#     sleep(0.1)
+# recorder.close() @endcode
+class TraceRecorder():
+
+    ## @param[in] directory Directory of the trace (created if it does not exist). The chunks of a previous trace are replaced (the other files are kept).
+    # @param[in] network rcs_network.RCSNetwork instance with the robots to be recorded.
+    # @param[in] line_of_sight Boolean to record (or not) the line-of-sight of each pair (one 'distance_and_view' request per pair, unless the network has a local 'los' engine).
+    # @param[in] plm Boolean to record (or not) the path losses of the Path Loss Maps ('plm_'+robotname+'.tif').
+    # If None, they are only recorded if the model of the network reads the rasters (see rcs.CommunicationModel.inputs), so the
+    # other models do not need the Path Loss Map files.
+    # @param[in] chunk_ticks Number of ticks of each chunk.
+    def __init__(self, directory, network, line_of_sight = True, plm = None, chunk_ticks = 1024):
+        ## @brief Directory of the trace
+        self.directory = directory
+        self.__network = network
+        self.__robots = network.get_robots()
+        n = len(self.__robots)
+        i, j = numpy.triu_indices(n, 1)
+        ## @brief Indices (P x 2) of the robots of each pair
+        self.__pairs = numpy.column_stack((i, j))
+        self.__chunk_ticks = chunk_ticks
+        if plm is None:
+            plm = 'rasters' in rcs.models.get(network.get_model_specifications(False)).inputs
+
+        self.__columns = {'time': ((), 'float64'), 'positions': ((n, 3), 'float64'),
+                          'distance': ((len(i),), 'float64'), 'loss': ((len(i),), 'float32')}
+        if line_of_sight:
+            self.__columns['line_of_sight'] = ((len(i),), 'bool')
+        if plm:
+            self.__columns['pathloss'] = ((len(i),), 'float32')
+            self.__columns['data_rate'] = ((len(i),), 'float32')
+        ## @brief Dictionary with the current chunk of each column
+        self.__buffers = dict((name, numpy.empty((chunk_ticks,) + shape, dtype = dtype)) for name, (shape, dtype) in self.__columns.items())
+        self.__ticks = 0
+        ## @brief List with the number of ticks of each saved chunk
+        self.__chunks = []
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.__remove_chunks()
+        self.__save_description()
+
+    ## @return List with the names of the robots, in the order of the 'positions' column.
+    def get_robots(self):
+        return list(self.__robots)
+
+    ## @return Array (P x 2) with the indices (see get_robots()) of the robots of each pair, in the order of the pair columns.
+    def get_pairs(self):
+        return self.__pairs.copy()
+
+    ## @brief Reads the poses of the robots (one read per robot, see rcs.MorseSnapshot) and appends one tick to the trace.
+    # @return The number of ticks recorded.
+    def record(self):
+        network = self.__network
+        spec = network.get_specifications()
+        i, j = self.__pairs[:, 0], self.__pairs[:, 1]
+        t = self.__ticks % self.__chunk_ticks
+        buffers = self.__buffers
+
+        positions = network.update()
+        buffers['time'][t] = time.time()
+        buffers['positions'][t] = positions
+        buffers['distance'][t] = rcs.batch_distance(positions[i], positions[j])
+        buffers['loss'][t] = rcs.batch_free_space_loss(buffers['distance'][t], spec['freq'])
+        if 'line_of_sight' in buffers:
+            buffers['line_of_sight'][t] = network.get_lineofsight_matrix(False)[i, j]
+        if 'pathloss' in buffers:
+            # The samplings that give Data Rate classes do not keep the path losses
+            sampling = 'full' if rcs.plm_cache.gives_classes(spec['plm_sampling']) else spec['plm_sampling']
+            pathlosses = numpy.empty(len(self.__robots))
+            for k, robot in enumerate(self.__robots):
+                pathlosses[k] = rcs.batch_pathloss('plm_'+robot+'.tif', positions[k], sampling)
+            buffers['pathloss'][t] = numpy.maximum(pathlosses[i], pathlosses[j])
+            buffers['data_rate'][t] = rcs.batch_data_rate(buffers['pathloss'][t], spec['plm'])
+
+        self.__ticks += 1
+        if self.__ticks % self.__chunk_ticks == 0:
+            self.__save_chunk(self.__chunk_ticks)
+        return self.__ticks
+
+    ## @brief Saves the ticks not saved yet. The recorder must not be used afterwards.
+    def close(self):
+        if self.__ticks % self.__chunk_ticks:
+            self.__save_chunk(self.__ticks % self.__chunk_ticks)
+        logger.info("Trace '%s': %i ticks of %i robots recorded" %(self.directory, self.__ticks, len(self.__robots)))
+
+    ## @param[in] ticks Number of ticks of the current chunk.
+    def __save_chunk(self, ticks):
+        for name, buffer in self.__buffers.items():
+            numpy.save(os.path.join(self.directory, '%s.%05i.npy' %(name, len(self.__chunks))), buffer[:ticks])
+        self.__chunks.append(ticks)
+        self.__save_description()
+
+    ## @brief Removes the chunks of a previous trace in the directory: only the files '<column>.<chunk>.npy' of the columns of this
+    # recorder and of the previous 'trace.json', so the other files of the directory are kept.
+    def __remove_chunks(self):
+        columns = set(self.__columns)
+        filename = os.path.join(self.directory, 'trace.json')
+        if os.path.isfile(filename):
+            try:
+                with open(filename) as f:
+                    columns.update(json.load(f).get('columns', []))
+            except (ValueError, AttributeError):
+                logger.warning("Trace '%s': the previous 'trace.json' could not be read" %self.directory)
+        for filename in os.listdir(self.directory):
+            parts = filename.split('.')
+            if (len(parts) == 3) and (parts[0] in columns) and (len(parts[1]) == 5) and parts[1].isdigit() and (parts[2] == 'npy'):
+                os.remove(os.path.join(self.directory, filename))
+
+    ## @brief Writes the description of the trace ('trace.json').
+    def __save_description(self):
+        spec = self.__network.get_specifications()
+        description = {'robots': self.__robots, 'pairs': self.__pairs.tolist(), 'chunks': self.__chunks,
+                       'columns': sorted(self.__columns), 'freq': spec['freq'], 'plm': spec['plm']}
+        with open(os.path.join(self.directory, 'trace.json'), 'w') as f:
+            json.dump(description, f)
+
+
+## @brief This class re-runs the communication models of @ref rcs.RCS over a trace recorded by TraceRecorder, without Morse.
+# @details Each chunk is read with a memory map and evaluated at once with the batch functions of rcs, so a whole
+# mission can be evaluated with many specifications in a short time.
+# @details Usage examples:
+# @code trace = rcs_trace.TraceReplay('mission_1')
+# for threshold in range(5, 50, 5):
+#     links = trace.replay(model = 'distance', distance_threshold = threshold)    # ticks x pairs
+#     print(threshold, links.mean())
+# rates = trace.replay(model = 'plm', plm = {'t1':10, 't2':20, 't3':30, 'dr0':4, 'dr1':3, 'dr2':2, 'dr3':1}) @endcode
+class TraceReplay():
+
+    ## @param[in] directory Directory of the trace.
+    # @exception IOError if the directory does not have a trace.
+    def __init__(self, directory):
+        filename = os.path.join(directory, 'trace.json')
+        if not os.path.isfile(filename):
+            raise IOError('Trace "%s" could not be opened' %directory)
+        with open(filename) as f:
+            description = json.load(f)
+        ## @brief Directory of the trace
+        self.directory = directory
+        ## @brief Description of the trace: robots, pairs, chunks, columns, and the frequency and Path Loss Map parameters of the recording
+        self.description = description
+        self.__pairs = numpy.array(description['pairs'], dtype = int).reshape(-1, 2)
+
+    ## @return List with the names of the robots, in the order of the 'positions' column.
+    def get_robots(self):
+        return list(self.description['robots'])
+
+    ## @return Array (P x 2) with the indices (see get_robots()) of the robots of each pair, in the order of the pair columns.
+    def get_pairs(self):
+        return self.__pairs.copy()
+
+    ## @return The number of ticks of the trace.
+    def get_ticks(self):
+        return sum(self.description['chunks'])
+
+    ## @param[in] names List with the names of the columns.
+    # @return Iterator over the chunks: dictionaries {name: memory mapped array} with the ticks of each chunk.
+    # @exception KeyError if a column was not recorded (raised by the call, before the iteration).
+    def iter_chunks(self, names):
+        for name in names:
+            if name not in self.description['columns']:
+                raise KeyError('The column "%s" was not recorded in the trace "%s"' %(name, self.directory))
+        return self.__iter_chunks(names)
+
+    ## @param[in] names List with the names of the columns (recorded).
+    # @return Iterator over the chunks (see iter_chunks()).
+    def __iter_chunks(self, names):
+        for k in range(len(self.description['chunks'])):
+            yield dict((name, numpy.load(os.path.join(self.directory, '%s.%05i.npy' %(name, k)), mmap_mode = 'r')) for name in names)
+
+    ## @param[in] name Name of the column.
+    # @return Array with the column of the whole trace (ticks x ...).
+    def get_column(self, name):
+        chunks = [chunk[name] for chunk in self.iter_chunks([name])]
+        if not chunks:
+            return numpy.empty((0,))
+        return numpy.concatenate(chunks)
+
+    ## @param[in] kwargs The same arguments of @ref rcs.RCS.set_model_specifications() (the defaults of rcs.RCS are used for the others).
+    # @return Array (ticks x pairs) with the result of each pair of robots in each tick (the same of rcs.RCS.can_communicate()).
+    # @details The models get the recorded columns as inputs (see rcs.CommunicationModel.batch_evaluate(), with the ticks as leading dimension):
+    # the line-of-sight is the recorded one, or the one of the local engine given in 'los' (evaluated from the positions),
+    # and the models with Path Loss Map rasters get the recorded path losses ('pathloss' input), so the 'plm_sampling' specification is not used.
+    def replay(self, **kwargs):
+        s = self.__get_specifications(kwargs)
+        i, j = self.__pairs[:, 0], self.__pairs[:, 1]
+        model = rcs.models.get(s['model'])
+        local_view = ('line_of_sight' in model.inputs) and (s['los'] is not None)
+        names = ['positions']
+        if 'distance' in model.inputs:
+            names.append('distance')
+        if ('line_of_sight' in model.inputs) and not local_view:
+            names.append('line_of_sight')
+        if 'rasters' in model.inputs:
+            names.append('pathloss')
+
+        results = []
+        for chunk in self.iter_chunks(names):
+            inputs = dict(chunk, robots = self.get_robots(), pairs = (i, j))
+            if local_view:
+                positions = chunk['positions']
+                views = s['los'].batch_line_of_sight(positions[:, i].reshape(-1, 3), positions[:, j].reshape(-1, 3))
+                inputs['line_of_sight'] = views.reshape(len(positions), len(i))
+            results.append(model.batch_evaluate(s, inputs))
+
+        if not results:
+            return numpy.zeros((0, len(i)))
+        return numpy.concatenate(results)
+
+    ## @param[in] kwargs The same arguments of @ref rcs.RCS.set_model_specifications().
+    # @return Dictionary with the specifications, using the defaults of rcs.RCS for the missing (or wrong) ones.
+    def __get_specifications(self, kwargs):
+        s = rcs.RCS.get_default_specifications()
+        if ("model" in kwargs) and rcs.RCS.model_exists(kwargs["model"]):
+            s['model'] = kwargs["model"].lower()
+        for key in ('distance_threshold', 'freq', 'free_space_threshold') + tuple(rcs.models.get_defaults()):
+            if key in kwargs:
+                s[key] = kwargs[key]
+        if ("plm" in kwargs) and rcs.RCS.check_plm_dictionary(kwargs["plm"]):
+            s['plm'] = kwargs["plm"]
+        if ("los" in kwargs) and ((kwargs["los"] is None) or hasattr(kwargs["los"], 'batch_line_of_sight')):
+            s['los'] = kwargs["los"]
+        return s
@@ -0,0 +1,145 @@
+import math
+import rcs
+from rcs import logger
+
+
+## @brief This class keeps track of the state of several links (rcs.RCS instances) and notifies only their changes.
+# @details On each update(), the poses of the robots are read (see rcs.MorseSnapshot) and a link is only evaluated again when:
+# - one of its robots moved more than the tolerance since its last evaluation, and
+# - for the models with a cutoff distance (e.g. 'distance' and 'free_space_loss'), the movement could have crossed it: if the last distance
+# plus (or minus) the movement is still on the same side of the threshold, the result cannot have changed.
+# @details The callbacks are only called when a link goes up or down, or when its Data Rate changes (model 'plm').
+# @details Usage examples:
+# @code tracker = rcs_tracker.LinkTracker(tolerance = 0.2)
+# tracker.add(r1r2_1); tracker.add(r1r2_4)
+# tracker.subscribe(lambda link, previous, current: print(link.get_robot_names(), previous, current))
+# while True:
+#     tracker.update()
+#     sleep(0.1) @endcode
+class LinkTracker():
+
+    ## @param[in] tolerance Units: meters. Movements of the robots below this distance do not evaluate the links again.
+    def __init__(self, tolerance = 0.1):
+        ## @brief Units: meters
+        self.tolerance = tolerance
+        ## @brief State of each link: dictionaries with the link, the poses and the distance of the last evaluation, and its result
+        self.__links = []
+        ## @brief Functions called when the result of a link changes: callback(link, previous, current)
+        self.__callbacks = []
+        ## @brief Morse connection (shared, see rcs.MorsePool)
+        self.__morse = rcs.morse_pool.acquire()
+        ## @brief Number of evaluations of the links and number of evaluations skipped
+        self.evaluations = 0
+        self.skipped = 0
+
+    ## @details This method releases the connection with the  morse simulation (it is closed by its last user).
+    def __del__(self):
+        self.__morse.close()
+
+    ## @param[in] link rcs.RCS instance to be tracked. Its result is evaluated right away.
+    def add(self, link):
+        state = {'link': link, 'poses': None, 'distance': None, 'result': None}
+        self.__links.append(state)
+        self.__evaluate(state, self.__get_poses(link))
+
+    ## @param[in] link rcs.RCS instance to stop tracking.
+    def remove(self, link):
+        self.__links = [state for state in self.__links if state['link'] is not link]
+
+    ## @param[in] callback Function called when the result of a link changes: callback(link, previous, current).
+    def subscribe(self, callback):
+        self.__callbacks.append(callback)
+
+    ## @param[in] callback Function previously given to subscribe().
+    def unsubscribe(self, callback):
+        self.__callbacks.remove(callback)
+
+    ## @param[in] link rcs.RCS instance being tracked.
+    # @return The last result of the link (the same of can_communicate()).
+    def get_result(self, link):
+        for state in self.__links:
+            if state['link'] is link:
+                return state['result']
+
+    ## @brief Evaluates again the links that may have changed, and calls the callbacks of the ones that did.
+    # @return List with the tuples (link, previous, current) of the links that changed.
+    def update(self):
+        changes = []
+        for state in self.__links:
+            poses = self.__get_poses(state['link'])
+            if not self.__may_have_changed(state, poses):
+                self.skipped += 1
+                continue
+            previous = state['result']
+            current = self.__evaluate(state, poses)
+            if current != previous:
+                changes.append((state['link'], previous, current))
+
+        for link, previous, current in changes:
+            names = link.get_robot_names()
+            logger.info("RCS tracker: '%s' & '%s' changed from %s to %s" %(names['r1'].upper(), names['r2'].upper(), previous, current))
+            for callback in self.__callbacks:
+                callback(link, previous, current)
+        return changes
+
+    ## @param[in] state State of the link.
+    # @param[in] poses Dictionary {'r1': pose, 'r2': pose} with the current poses of the robots.
+    # @return True if the result of the link may be different from the last evaluation.
+    def __may_have_changed(self, state, poses):
+        if state['poses'] is None:
+            # Never evaluated (see __evaluate())
+            return True
+        moved = self.__movement(state['poses']['r1'], poses['r1']) + self.__movement(state['poses']['r2'], poses['r2'])
+        if moved < self.tolerance:
+            return False
+
+        threshold = self.__get_distance_threshold(state['link'])
+        if (threshold is None) or (state['distance'] is None):
+            return True
+        # The distance between the robots changed at most 'moved' meters
+        if state['distance'] < threshold:
+            return state['distance'] + moved >= threshold
+        else:
+            return state['distance'] - moved < threshold
+
+    ## @param[in] state State of the link.
+    # @param[in] poses Dictionary {'r1': pose, 'r2': pose} with the current poses of the robots.
+    # @return The result of the link.
+    # @details If the 'distance_and_view' service fails, the error is logged (like rcs.RCS) and the link keeps its previous state and result,
+    # so it is evaluated again on the next update().
+    def __evaluate(self, state, poses):
+        link = state['link']
+        distance = distance_and_view = None
+        if 'distance_and_view' in link.get_required_inputs():
+            names = link.get_robot_names()
+            try:
+                distance_and_view = rcs.snapshot.get_distance_and_view(self.__morse, names['r1'], names['r2'])
+            except rcs.pymorse.MorseServerError as mse:
+                logger.error('Oups! An error occurred! %s', mse)
+                return state['result']
+            distance = distance_and_view[0]
+        state['distance'] = distance
+        state['result'] = link.evaluate(distance_and_view = distance_and_view, poses = poses)
+        state['poses'] = poses
+        self.evaluations += 1
+        return state['result']
+
+    ## @param[in] link rcs.RCS instance.
+    # @return The distance (meters) below which the robots can communicate, or None if the model does not depend only on the distance.
+    # @see rcs.CommunicationModel.get_cutoff_distance()
+    def __get_distance_threshold(self, link):
+        spec = link.get_specifications()
+        return rcs.models.get(spec['model']).get_cutoff_distance(spec)
+
+    ## @param[in] link rcs.RCS instance.
+    # @return Dictionary {'r1': pose, 'r2': pose} with the current poses of the robots of the link.
+    def __get_poses(self, link):
+        names = link.get_robot_names()
+        return {'r1': rcs.snapshot.get_pose(self.__morse, names['r1'], names['r1_pose']),
+                'r2': rcs.snapshot.get_pose(self.__morse, names['r2'], names['r2_pose'])}
+
+    ## @param[in] previous Pose of the robot in the last evaluation.
+    # @param[in] current Current pose of the robot.
+    # @return The distance (meters) moved by the robot.
+    def __movement(self, previous, current):
+        return math.sqrt((current['x'] - previous['x'])**2 + (current['y'] - previous['y'])**2 + (current['z'] - previous['z'])**2)
@@ -0,0 +1,15 @@
+import pytest
+import rcs_history
+
+
+@pytest.mark.parametrize('kwargs', [{'capacity': 0}, {'window': 0}, {'alpha': 0}, {'alpha': 1.5}, {'up': 0.7}, {'up': 0.3, 'down': 0.7}])
+def test_invalid_parameters(kwargs):
+    with pytest.raises(ValueError):
+        rcs_history.LinkHistory(**kwargs)
+
+
+def test_hysteresis():
+    history = rcs_history.LinkHistory(alpha = 1, up = 0.7, down = 0.3)
+    for rate, link in ((1, True), (0.5, True), (0.2, False), (0.5, False), (0.8, True)):
+        history.append(10, 50, rate, timestamp = 0)
+        assert history.get_link() == link
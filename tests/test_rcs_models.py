@@ -0,0 +1,28 @@
+import pytest
+import rcs
+
+
+class LogDistanceModel(rcs.CommunicationModel):
+    name = 'log_distance_test'
+    inputs = ('distance',)
+
+    def evaluate(self, spec, inputs):
+        return int(inputs['distance'] < spec['distance_threshold'])
+
+
+## @brief A model with no name or unknown inputs is not registered, and the error can be handled by the caller.
+@pytest.mark.parametrize('name, inputs', [(None, ('distance',)), ('', ('distance',)), ('log_distance_test', ('distance', 'weather'))])
+def test_register_invalid_model(name, inputs):
+    model = LogDistanceModel()
+    model.name = name
+    model.inputs = inputs
+    with pytest.raises(ValueError):
+        rcs.models.register(model)
+    assert not rcs.models.exists('log_distance_test')
+
+
+def test_register_model():
+    registry = rcs.ModelRegistry()
+    registry.register(LogDistanceModel())
+    assert registry.names() == ['log_distance_test']
+    assert registry.get('LOG_DISTANCE_TEST').evaluate({'distance_threshold': 10}, {'distance': 5}) == 1
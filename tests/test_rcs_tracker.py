@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip('gdal')
+import rcs_benchmark
+rcs_benchmark.install_fake_morse()
+import rcs, rcs_tracker
+
+
+@pytest.fixture
+def scene():
+    rcs_benchmark.FakeMorse.scene = rcs_benchmark.FakeScene(3, 100, 100)
+    rcs_benchmark.FakeMorse.latency = 0.0
+    return rcs_benchmark.FakeMorse.scene
+
+
+## @brief A failed 'distance_and_view' request of one link keeps its previous result, and the other links are still evaluated.
+def test_update_with_failing_rpc(scene, monkeypatch):
+    scene.poses['robo1'].update(x = 10.0, y = 10.0)
+    scene.poses['robo2'].update(x = 20.0, y = 10.0)
+    scene.poses['robo3'].update(x = 30.0, y = 10.0)
+    r1r2 = rcs.RCS('robo1', 'robo2', model = 'distance', distance_threshold = 15)
+    r1r3 = rcs.RCS('robo1', 'robo3', model = 'distance', distance_threshold = 15)
+    tracker = rcs_tracker.LinkTracker(tolerance = 0.1)
+    tracker.add(r1r2)
+    tracker.add(r1r3)
+    assert (tracker.get_result(r1r2), tracker.get_result(r1r3)) == (1, 0)
+
+    distance_and_view = scene.distance_and_view
+    def failing(r1, r2):
+        if (r1, r2) == ('robo1', 'robo2'):
+            raise rcs.pymorse.MorseServerError('robo2 is not available')
+        return distance_and_view(r1, r2)
+    monkeypatch.setattr(scene, 'distance_and_view', failing)
+
+    # Both links change, but only robo1 & robo3 can be evaluated
+    scene.poses['robo1'].update(x = 40.0)
+    changes = tracker.update()
+    assert [(link, previous, current) for link, previous, current in changes] == [(r1r3, 0, 1)]
+    assert tracker.get_result(r1r2) == 1
+
+    # The link is evaluated again once the service answers
+    monkeypatch.setattr(scene, 'distance_and_view', distance_and_view)
+    assert tracker.update() == [(r1r2, 1, 0)]
+
+
+## @brief A link whose first evaluation failed is evaluated on the next update().
+def test_add_with_failing_rpc(scene, monkeypatch):
+    distance_and_view = scene.distance_and_view
+    def failing(r1, r2):
+        raise rcs.pymorse.MorseServerError('robo2 is not available')
+    monkeypatch.setattr(scene, 'distance_and_view', failing)
+    r1r2 = rcs.RCS('robo1', 'robo2', model = 'distance', distance_threshold = 1000)
+    tracker = rcs_tracker.LinkTracker()
+    tracker.add(r1r2)
+    assert tracker.get_result(r1r2) is None
+
+    monkeypatch.setattr(scene, 'distance_and_view', distance_and_view)
+    assert tracker.update() == [(r1r2, None, 1)]